@@ -1,18 +1,18 @@
 import streamlit as st
 from streamlit.logger import get_logger
-from st_files_connection import FilesConnection
-from st_pages import Page, show_pages, add_page_title
-import pandas as pd
-import plotly.express as px
-import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from st_pages import Page, show_pages
+import plotly.io as pio
+# figures are served from cached JSON specs, plotly.express only loads when one is rebuilt
+from overview_figures import FigureCache
+from stage_trace import TRACE, span
+from utils import show_stages
 
 st.set_page_config(
     page_title="BoardGameWhiz",
     page_icon="👋",
     layout="wide"
 )
+TRACE.begin("overview")
 
 
 LOGGER = get_logger(__name__)
@@ -68,107 +68,23 @@ st.markdown(
 """
 )
 
-@st.cache_data(ttl=3600)
-def line_chart():
-    # df_ratings = df[['bgg_id', 'name', 'year', 'avg_rating']]
-    #df_ratings = df_ratings[(df_ratings['year'] >= 2000) & (df_ratings['year'] <= 2023)]
-    #df_ratings_avg = df_ratings.groupby('year')['avg_rating'].mean().reset_index()
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
 
-    df_ratings_avg = pd.read_csv("./dataset/df_ratings_avg.csv")
+# keyed by the figure version, so an updated CSV gets a fresh figure; parsed once and
+# shared read-only by every session (st.plotly_chart serializes a copy), so a warm rerun
+# parses no JSON. Two versions of each of the four figures, across a dataset update.
+@st.cache_resource(max_entries=8)
+def get_figure(name, version):
+    spec = get_figure_cache().spec(name, version)
+    LOGGER.info("figure %s payload: %d bytes", name, len(spec))
+    return pio.from_json(spec), len(spec)
 
-    # fig = px.line(df_ratings_avg, x="year", y="avg_rating",
-    #         labels={"year": "Year Published","avg_rating": "Avg User Rating"})
-
-    # fig.add_bar(x=df_ratings_avg["year"], y=df_ratings_avg["count_game"], name="Game Count")
-
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig2 = px.line(df_ratings_avg, x="year", y="avg_rating",
-             labels={"year": "Year Published","avg_rating": "Avg User Rating"})
-    for t in fig2.select_traces():
-        fig.add_trace(t, secondary_y = False)
-
-    fig.add_trace(go.Bar(x = df_ratings_avg["year"], y = df_ratings_avg["count_game"], name="Game Count"), secondary_y = True)
-    fig.update_yaxes(range=[4,6.8], secondary_y=False)
-    fig.update_yaxes(range=[1000,10000], showgrid=False, secondary_y=True)
-
-    fig.update_layout(legend=dict(
-    yanchor="top",
-    y=1.1,
-    xanchor="left",
-    x=0.01
-    ))
-
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)
-
-@st.cache_data(ttl=3600)
-def bar_chart():
-    # df_genre = df[['bgg_id', 'name', 'year', 'avg_rating','avg_rating_group', 'abstracts', 'cgs', 'childrensgames', 'familygames', 'partygames', 'strategygames', 'thematic', 'wargames']].copy()
-    # df_genre = df_genre[df_genre['avg_rating'] > 0.00]
-    # df_genre = df_genre[['avg_rating_group','abstracts', 'cgs', 'childrensgames', 'familygames', 'partygames', 'strategygames', 'thematic', 'wargames']]
-    # genre_dict = {'abstracts': 'Abstract', 'cgs': 'Customizable', 'childrensgames': 'Children', 'familygames': 'Family', 'partygames': 'Party',
-    #         'strategygames': 'Strategy', 'thematic': 'Thematic', 'wargames': 'War'}
-    # df_genre = df_genre.rename(genre_dict, axis = 1)
-    # df_genre_rating = df_genre.groupby('avg_rating_group').sum().reset_index()
-    # df_genre_rating = pd.melt(df_genre_rating, id_vars=['avg_rating_group'])
-
-    df_genre_rating = pd.read_csv("./dataset/df_genre_rating.csv")
-    fig = px.bar(df_genre_rating, x="avg_rating_group", y="value", color="variable",
-        labels={"avg_rating_group": "User Rating","value": "Game Count", "variable": "Genre"})
-
-    fig.update_layout(legend=dict(
-        yanchor="top",
-        y=0.99,
-        xanchor="left",
-        x=0.01
-    ))
-
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)    
-
-@st.cache_data(ttl=3600)
-def scatter_chart():
-    # df_weights = df[['bgg_id', 'name', 'year', 'avg_rating', 'avg_weights', 'user_rating']].copy()
-    # df_weights['avg_rating'] = df_weights['avg_rating'].round(2)
-    # df_weights['avg_weights'] = df_weights['avg_weights'].round(2)
-
-    # df_weights =  df_weights[df_weights['user_rating'] >= 1000]
-
-    df_weights = pd.read_csv("./dataset/df_weights.csv")
-
-    fig = px.scatter(df_weights, x="avg_weights", y="avg_rating", opacity=0.5, hover_data=['name','year','user_rating'], 
-                 labels={"name":"Game","avg_weights": "Complexity","avg_rating": "Rating",'year':'Year','user_rating':'Votes'})
-
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)          
-
-@st.cache_data(ttl=3600)
-def heatmap():
-    # #new_df = df[(df['year'] >= 2000) & (df['year'] <= 2023)].copy()
-    # new_df = df.copy()
-    # my_col = new_df.columns[new_df.columns.str.contains('cat_')].to_list()
-    # my_col.append('year')
-    # new_df = new_df[my_col]
-
-    # # top 1000 games
-    # df_test = new_df.iloc[:1000].copy()
-
-    # col_to_delete = df_test.sum(axis=0, numeric_only = True).reset_index().rename({0:'value'}, axis = 1)
-    # col_to_delete = col_to_delete[col_to_delete['value'] == 0.0]['index'].to_list()
-    # col_to_delete = [i for i in col_to_delete if 'cat_' in i]
-    # df_matrix = df_test.drop(columns=col_to_delete)
-
-    # df_matrix.columns = df_matrix.columns.str.replace("cat_","")
-    # df_matrix = df_matrix.rename({'Industry / Manufacturing': 'Industry'}, axis = 1)
-    # df_matrix = df_matrix.groupby('year').sum()
-    # game_idx = df_matrix.sum().reset_index()
-    # fifty_idx = game_idx[game_idx[0] > 50]
-
-    # df_matrix = df_matrix[fifty_idx['index']]
-
-    df_matrix = pd.read_csv("./dataset/df_matrix.csv")
-    fig = px.imshow(df_matrix.T, labels={"x":"Year","y": "Category",'color':'Count'})
-    fig.update_layout(yaxis_title=None, yaxis = dict(tickfont = dict(size=10)))
-
-    #st.dataframe(df_matrix)
-    st.plotly_chart(fig, theme="streamlit", use_container_width=True)   
+def show_figure(name):
+    with span(f"figure {name}") as figure_span:
+        figure, figure_span["bytes"] = get_figure(name, get_figure_cache().version(name))
+        st.plotly_chart(figure, theme="streamlit", use_container_width=True)
 
 row1_1, row1_space1, row1_2 = st.columns((0.45, 0.1, 0.45))
 
@@ -176,12 +92,12 @@ row1_1, row1_space1, row1_2 = st.columns((0.45, 0.1, 0.45))
 with row1_1:
 
     st.subheader("Average User Ratings Trend")
-    line_chart()
+    show_figure("line_chart")
 
 # STACKED BAR CHART TO SHOW USER RATING BY GENRE
 with row1_2:
     st.subheader("User Rating by Genre")
-    bar_chart()
+    show_figure("bar_chart")
 
 row2_1, row1_space1, row2_2 = st.columns((0.45, 0.1, 0.45))
 
@@ -189,12 +105,14 @@ row2_1, row1_space1, row2_2 = st.columns((0.45, 0.1, 0.45))
 
 with row2_1:
     st.subheader("Complexity-Rating Trend")
-    scatter_chart()
+    show_figure("scatter_chart")
 
 with row2_2:
     st.subheader("Game Category Count")
-    heatmap()
+    show_figure("heatmap")
 
+show_stages(TRACE)
+TRACE.end()
 
 # if __name__ == "__main__":
 #     run(df)
@@ -0,0 +1,186 @@
+"""Overview aggregates derived from the raw boardgames table.
+
+Full build from a scrape, keeping the state needed for later incremental updates:
+
+    python aggregates.py build boardgames.csv --state dataset/aggregates_state --out dataset
+
+Monthly refresh from only the new or changed games (and optionally removed bgg_ids):
+
+    python aggregates.py update changed.csv --removed removed.txt --state dataset/aggregates_state --out dataset
+
+Both write df_ratings_avg.csv, df_genre_rating.csv, df_weights.csv and df_matrix.csv.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# line chart covers games published in this range
+YEAR_FROM, YEAR_TO = 2000, 2023
+
+GENRES = {'abstracts': 'Abstract', 'cgs': 'Customizable', 'childrensgames': 'Children', 'familygames': 'Family', 'partygames': 'Party',
+          'strategygames': 'Strategy', 'thematic': 'Thematic', 'wargames': 'War'}
+
+# scatter only shows games with at least this many votes
+MIN_VOTES = 1000
+
+# heatmap counts categories over the top ranked games, keeping categories seen more than this often
+TOP_GAMES = 1000
+MIN_CATEGORY_COUNT = 50
+
+
+class OverviewAggregates:
+    """Running per-year, per-rating-group and per-category sums behind the Overview charts.
+
+    games holds the last seen version of every game (only the columns the charts use),
+    so an update can subtract each changed game's old contribution and add its new one
+    instead of regrouping the whole catalogue.
+    """
+
+    def __init__(self, games, year_stats, genre_stats, category_stats, top_ids):
+        self.games = games
+        self.year_stats = year_stats
+        self.genre_stats = genre_stats
+        self.category_stats = category_stats
+        self.top_ids = top_ids
+
+    @staticmethod
+    def _columns(raw):
+        cats = [c for c in raw.columns if c.startswith('cat_')]
+        keep = ['bgg_id', 'name', 'year', 'avg_rating', 'avg_rating_group', 'avg_weights', 'user_rating']
+        keep += [c for c in ('rank',) if c in raw.columns]
+        keep += [g for g in GENRES if g in raw.columns] + cats
+        return raw[keep].set_index('bgg_id')
+
+    @staticmethod
+    def _year_part(games, sign = 1):
+        rows = games[(games['year'] >= YEAR_FROM) & (games['year'] <= YEAR_TO)]
+        # sum() skips unrated games, so the mean divides by rated_game rather than count_game
+        part = pd.DataFrame({'rating_sum': rows['avg_rating'], 'rated_game': rows['avg_rating'].notna(),
+                             'count_game': 1}).groupby(rows['year']).sum()
+        return part * sign
+
+    @staticmethod
+    def _genre_part(games, sign = 1):
+        rows = games[games['avg_rating'] > 0.00]
+        part = rows[[g for g in GENRES if g in rows.columns]].assign(_games=1)
+        return part.groupby(rows['avg_rating_group']).sum() * sign
+
+    @staticmethod
+    def _category_part(games, sign = 1):
+        cats = [c for c in games.columns if c.startswith('cat_')]
+        return games[cats].assign(_games=1).groupby(games['year']).sum() * sign
+
+    @staticmethod
+    def _top(games):
+        # top ranked games; without a rank column the table order is the ranking
+        if 'rank' in games.columns:
+            order = games['rank'].fillna(np.inf).to_numpy().argsort(kind='stable')
+            return games.index[order[:TOP_GAMES]]
+        return games.index[:TOP_GAMES]
+
+    @classmethod
+    def build(cls, raw):
+        """All aggregates from a full scrape, in one grouping pass per chart."""
+        games = cls._columns(raw)
+        top_ids = cls._top(games)
+        return cls(games, cls._year_part(games), cls._genre_part(games),
+                   cls._category_part(games.loc[top_ids]), pd.Index(top_ids))
+
+    def update(self, changed, removed_ids = ()):
+        """Apply new or changed games (full rows) and removed bgg_ids as deltas."""
+        changed = self._columns(changed)
+        touched = changed.index.union(pd.Index(removed_ids))
+        old = self.games.loc[self.games.index.intersection(touched)]
+
+        self.year_stats = _add(self.year_stats, self._year_part(old, -1), self._year_part(changed))
+        self.genre_stats = _add(self.genre_stats, self._genre_part(old, -1), self._genre_part(changed))
+
+        games = self.games.drop(index=old.index)
+        games = pd.concat([games, changed]) if len(changed) else games
+        top_ids = pd.Index(self._top(games))
+        # only games whose top-ranked membership or row changed move the category sums
+        left = self.top_ids.difference(top_ids).union(self.top_ids.intersection(old.index))
+        entered = top_ids.difference(self.top_ids).union(top_ids.intersection(changed.index))
+        self.category_stats = _add(self.category_stats,
+                                   self._category_part(self.games.loc[left], -1),
+                                   self._category_part(games.loc[entered]))
+        self.games = games
+        self.top_ids = top_ids
+
+    def ratings_avg(self):
+        stats = self.year_stats[self.year_stats['count_game'] > 0]
+        return pd.DataFrame({'year': stats.index.astype(int),
+                             'avg_rating': (stats['rating_sum'] / stats['rated_game']).to_numpy(),
+                             'count_game': stats['count_game'].astype(int).to_numpy()})
+
+    def genre_rating(self):
+        genre = self.genre_stats[self.genre_stats['_games'] > 0].drop(columns='_games')
+        genre = genre.rename(GENRES, axis=1).astype(int).reset_index()
+        return pd.melt(genre, id_vars=['avg_rating_group'])
+
+    def weights(self):
+        df = self.games[self.games['user_rating'] >= MIN_VOTES]
+        df = df[['name', 'year', 'avg_rating', 'avg_weights', 'user_rating']].reset_index()
+        df['avg_rating'] = df['avg_rating'].round(2)
+        df['avg_weights'] = df['avg_weights'].round(2)
+        return df
+
+    def matrix(self):
+        df_matrix = self.category_stats[self.category_stats['_games'] > 0].drop(columns='_games').astype(int)
+        df_matrix = df_matrix.loc[:, df_matrix.sum() > 0]
+        df_matrix.columns = df_matrix.columns.str.replace("cat_","")
+        df_matrix = df_matrix.rename({'Industry / Manufacturing': 'Industry'}, axis = 1)
+        return df_matrix.loc[:, df_matrix.sum() > MIN_CATEGORY_COUNT].reset_index()
+
+    def write(self, out_dir):
+        self.ratings_avg().to_csv(os.path.join(out_dir, "df_ratings_avg.csv"), index=False)
+        self.genre_rating().to_csv(os.path.join(out_dir, "df_genre_rating.csv"), index=False)
+        self.weights().to_csv(os.path.join(out_dir, "df_weights.csv"), index=False)
+        self.matrix().to_csv(os.path.join(out_dir, "df_matrix.csv"), index=False)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.games.to_parquet(os.path.join(path, "games.parquet"))
+        self.year_stats.to_parquet(os.path.join(path, "year_stats.parquet"))
+        self.genre_stats.to_parquet(os.path.join(path, "genre_stats.parquet"))
+        self.category_stats.to_parquet(os.path.join(path, "category_stats.parquet"))
+
+    @classmethod
+    def load(cls, path):
+        games = pd.read_parquet(os.path.join(path, "games.parquet"))
+        return cls(games,
+                   pd.read_parquet(os.path.join(path, "year_stats.parquet")),
+                   pd.read_parquet(os.path.join(path, "genre_stats.parquet")),
+                   pd.read_parquet(os.path.join(path, "category_stats.parquet")),
+                   pd.Index(cls._top(games)))
+
+
+def _add(stats, *deltas):
+    return pd.concat([stats, *deltas]).groupby(level=0).sum().sort_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the Overview aggregates.")
+    parser.add_argument("mode", choices=["build", "update"])
+    parser.add_argument("games", help="CSV of the full scrape (build) or of new/changed games (update)")
+    parser.add_argument("--removed", help="text file of removed bgg_ids, one per line (update only)")
+    parser.add_argument("--state", required=True, help="directory holding the aggregation state")
+    parser.add_argument("--out", default="./dataset", help="directory to write the chart CSVs to")
+    args = parser.parse_args()
+
+    raw = pd.read_csv(args.games)
+    if args.mode == "build":
+        aggregates = OverviewAggregates.build(raw)
+    else:
+        aggregates = OverviewAggregates.load(args.state)
+        removed = np.loadtxt(args.removed, dtype=np.int64, ndmin=1) if args.removed else ()
+        aggregates.update(raw, removed)
+    aggregates.save(args.state)
+    aggregates.write(args.out)
+    print(f"{args.mode}: {len(raw)} games -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Approximate nearest-neighbour backend for the Recommender.
+
+Games are embedded in a vector space where Euclidean distance approximates Gower:
+range-normalized numeric features as they are, categorical features one-hot encoded
+(hashed into CAT_BUCKETS dimensions when a column has more values). An IVF index
+(k-means coarse quantizer plus inverted lists) picks candidates from the clusters
+nearest to the query, and the candidates are re-ranked with exact Gower distances.
+"""
+import numpy as np
+
+from recommender import TOP_K, find_games, recommendations, top_k
+from stage_trace import span
+
+# one-hot dimensions kept per categorical column
+CAT_BUCKETS = 32
+
+# clusters searched per query, and candidates re-ranked with exact Gower
+DEFAULT_PROBE = 8
+DEFAULT_CANDIDATES = 1024
+
+# rows used to train the k-means quantizer
+TRAIN_SAMPLE = 20000
+
+
+def embed(store, rows = None):
+    """float32 embedding of the given row positions (all rows by default)."""
+    num = store.numeric(rows)
+    cat = store.cat if rows is None else store.cat[rows]
+    active = store.num_range != 0
+    # a missing numeric value sits in the middle of its column's range
+    parts = [np.nan_to_num(num[:, active], nan=0.5)]
+    for c in range(cat.shape[1]):
+        codes = cat[:, c]
+        onehot = np.zeros((len(codes), CAT_BUCKETS), dtype=np.float32)
+        present = codes >= 0
+        onehot[np.flatnonzero(present), codes[present] % CAT_BUCKETS] = np.sqrt(0.5)
+        parts.append(onehot)
+    return np.ascontiguousarray(np.hstack(parts), dtype=np.float32)
+
+
+def _assign(x, centroids, chunk = 8192):
+    out = np.empty(len(x), dtype=np.int32)
+    c_sq = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(x), chunk):
+        block = x[start:start + chunk]
+        out[start:start + chunk] = (c_sq - 2 * block @ centroids.T).argmin(axis=1)
+    return out
+
+
+def _kmeans(x, k, n_iter, rng):
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(x, centroids)
+        order = np.argsort(assign, kind='stable')
+        lists, starts = np.unique(assign[order], return_index=True)
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        counts = np.diff(np.append(starts, len(x)))
+        # empty clusters keep their previous centroid
+        centroids[lists] = sums / counts[:, None]
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over the game embeddings of a FeatureStore."""
+
+    def __init__(self, store, n_lists = None, n_probe = DEFAULT_PROBE, n_candidates = DEFAULT_CANDIDATES,
+                 n_iter = 10, seed = 0):
+        rng = np.random.default_rng(seed)
+        emb = embed(store)
+        n = len(emb)
+        self.n_lists = n_lists or max(1, min(n, int(4 * np.sqrt(n))))
+        train = emb if n <= TRAIN_SAMPLE else emb[rng.choice(n, TRAIN_SAMPLE, replace=False)]
+        self.centroids = _kmeans(train, self.n_lists, n_iter, rng)
+
+        assign = _assign(emb, self.centroids)
+        self.rows = np.argsort(assign, kind='stable').astype(np.int32)
+        self.offsets = np.searchsorted(assign[self.rows], np.arange(self.n_lists + 1))
+        self.store = store
+        self.n_probe = n_probe
+        self.n_candidates = n_candidates
+
+    def candidates(self, pos, mask, n_candidates, n_probe):
+        """Row positions in mask from the clusters nearest to pos. Probes at least n_probe
+        clusters, and more until n_candidates rows are collected."""
+        query = embed(self.store, [pos])[0]
+        order = ((self.centroids - query) ** 2).sum(axis=1).argsort()
+        found, total = [], 0
+        for probed, lst in enumerate(order):
+            rows = self.rows[self.offsets[lst]:self.offsets[lst + 1]]
+            if mask is not None:
+                rows = rows[mask[rows]]
+            found.append(rows)
+            total += len(rows)
+            if probed + 1 >= n_probe and total >= n_candidates:
+                break
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int32)
+
+    def search(self, pos, mask, n):
+        """The n approximately nearest rows of pos in mask, as (positions, exact distances)."""
+        rows = self.candidates(pos, mask, max(self.n_candidates, n), self.n_probe)
+        dist = self.store.distances_rows(pos, rows, mask)
+        best = top_k(dist, n)
+        return rows[best], dist[best]
+
+
+def find_games_ann(game_df, selected_row, selected_year = None, selected_player = None, selected_rating = None,
+                   selected_rated = None, store = None, ann = None, k = TOP_K):
+    """find_games over the IVF candidates, exact when the index is missing or the filters
+    leave too few candidates."""
+    if store is not None and ann is not None:
+        pos = store.position(selected_row.index[0])
+        with span("filter"):
+            mask = store.filter_mask(pos, selected_year, selected_player, selected_rating, selected_rated)
+        with span("ann search"):
+            idx, dist = ann.search(pos, mask, k + 1)
+        if len(idx) == k + 1:
+            return recommendations(game_df, store, pos, idx, dist, k)
+
+    return find_games(game_df, selected_row, selected_year, selected_player, selected_rating,
+                      selected_rated, store=store, k=k)
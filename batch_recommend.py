@@ -0,0 +1,147 @@
+"""Headless batch recommendations: the Recommender page's results for many games at once.
+
+    python batch_recommend.py game_df.csv queries.csv recommendations.parquet --workers 4
+
+queries.csv has a bgg_id column and optionally year, player, rating and rated columns
+(the page's filters, empty for unset); --year/--player/--rating/--rated apply a filter to
+every query without one. The output (CSV or Parquet, by extension) has one row per
+recommended game: query_bgg_id, rank, bgg_id and distance, in the same order the page
+shows them. Results are written block by block as the pool finishes them.
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from recommender import TOP_K, FeatureStore, init_worker_store, top_k, worker_store
+
+DEFAULT_BLOCK = 64
+
+FILTER_ARGS = ['year', 'player', 'rating', 'rated']
+
+OUTPUT_COLUMNS = ['query_bgg_id', 'rank', 'bgg_id', 'distance']
+
+def recommend_block(store, positions, filters, k = TOP_K):
+    """Recommendations for a block of query row positions, each with its own
+    (year, player, rating, rated) filters, as a DataFrame of OUTPUT_COLUMNS."""
+    masks = [store.filter_mask(pos, *f) for pos, f in zip(positions, filters)]
+    scales = [store.scale_for(pos, mask) for pos, mask in zip(positions, masks)]
+    dist = store.distances_many(positions, scales)
+
+    parts = []
+    for pos, mask, row in zip(positions, masks, dist):
+        idx = top_k(row, k + 1, mask)
+        # same slicing as recommender.recommendations
+        idx = idx[1:k + 1] if store.has_family(pos) else idx[0:k + 1]
+        parts.append(pd.DataFrame({'query_bgg_id': store.bgg_id[pos],
+                                   'rank': np.arange(1, len(idx) + 1),
+                                   'bgg_id': store.bgg_id[idx],
+                                   'distance': row[idx]}))
+    if not parts:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
+
+
+def _run_block(args):
+    positions, filters, k = args
+    return recommend_block(worker_store(), positions, filters, k)
+
+
+def _filters(value):
+    # empty cells and 0 both mean "no filter", as on the page
+    return None if pd.isna(value) or not value else int(value)
+
+
+def read_queries(store, queries, defaults = None):
+    """Row positions and filter tuples of a queries DataFrame. Unknown bgg_ids are dropped."""
+    defaults = defaults or {}
+    positions = store.positions_of(queries['bgg_id'])
+    known = positions >= 0
+    queries = queries[known]
+    filters = []
+    for name in FILTER_ARGS:
+        column = queries[name] if name in queries.columns else pd.Series(np.nan, index=queries.index)
+        filters.append([_filters(v) for v in column.fillna(defaults.get(name) or np.nan)])
+    return positions[known], list(zip(*filters)), int((~known).sum())
+
+
+class ResultWriter:
+    """Appends result blocks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        self._header = True
+
+    def write(self, block):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(block, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            block.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def run_batch(store, positions, filters, out_path, k = TOP_K, workers = None, block = DEFAULT_BLOCK):
+    """Recommend for every query and stream the results to out_path. Returns the number of
+    result rows written."""
+    blocks = [(positions[start:start + block], filters[start:start + block], k)
+              for start in range(0, len(positions), block)]
+    writer = ResultWriter(out_path)
+    written = 0
+    try:
+        if workers == 1:
+            for result in (recommend_block(store, *args) for args in blocks):
+                writer.write(result)
+                written += len(result)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_store, initargs=(store,)) as pool:
+                for result in pool.map(_run_block, blocks):
+                    writer.write(result)
+                    written += len(result)
+        if not blocks:
+            writer.write(pd.DataFrame(columns=OUTPUT_COLUMNS))
+    finally:
+        writer.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch Recommender results for a list of games.")
+    parser.add_argument("game_df", help="path or gs:// url of game_df.csv")
+    parser.add_argument("queries", help="CSV with a bgg_id column and optional filter columns")
+    parser.add_argument("out", help="output .csv or .parquet file")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--workers", type=int, default=None, help="processes, 1 runs in-process")
+    parser.add_argument("--block", type=int, default=DEFAULT_BLOCK, help="queries per distance block")
+    for name in FILTER_ARGS:
+        parser.add_argument(f"--{name}", type=int, default=None, help=f"default {name} filter")
+    args = parser.parse_args()
+
+    store = FeatureStore(pd.read_csv(args.game_df))
+    defaults = {name: getattr(args, name) for name in FILTER_ARGS}
+    positions, filters, unknown = read_queries(store, pd.read_csv(args.queries), defaults)
+    if unknown:
+        print(f"Skipped {unknown} bgg_ids not in game_df")
+
+    started = time.perf_counter()
+    written = run_batch(store, positions, filters, args.out, args.k, args.workers, args.block)
+    elapsed = time.perf_counter() - started
+    qps = len(positions) / elapsed if elapsed else float("inf")
+    print(f"{len(positions)} queries, {written} rows in {elapsed:.1f}s ({qps:.1f} queries/s) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
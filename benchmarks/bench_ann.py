@@ -0,0 +1,69 @@
+"""Recall@10 and latency of the ANN backend against exact Gower.
+
+    python -m benchmarks.bench_ann --rows 100000 --queries 200
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from ann_index import DEFAULT_CANDIDATES, DEFAULT_PROBE, IVFIndex, find_games_ann
+from benchmarks.synthetic import make_catalogue
+from recommender import FeatureStore, find_games
+
+FILTERS = {
+    "no filters": (None, None, None, None),
+    "2 players, 7+": (None, 2, 7, None),
+    "since 2015, 500+ votes": (2015, None, None, 500),
+}
+
+
+def _ms(samples):
+    return statistics.median(samples) * 1e3, statistics.quantiles(samples, n=20)[-1] * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--probe", type=int, default=DEFAULT_PROBE)
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    game_df = make_catalogue(args.rows, args.seed)
+    store = FeatureStore(game_df)
+    started = time.perf_counter()
+    ann = IVFIndex(store, n_probe=args.probe, n_candidates=args.candidates)
+    print(f"{args.rows} games, {ann.n_lists} lists, index built in {time.perf_counter() - started:.1f}s")
+
+    queries = np.random.default_rng(args.seed + 1).choice(args.rows, args.queries, replace=False)
+    print(f"{'':24s} {'recall@10':>10s} {'exact p50/p95 ms':>18s} {'ann p50/p95 ms':>16s}")
+    for label, filters in FILTERS.items():
+        recalls, exact_t, ann_t = [], [], []
+        for q in queries:
+            row = game_df.iloc[[q]]
+            t0 = time.perf_counter()
+            find_games(game_df, row, *filters, store=store)
+            t1 = time.perf_counter()
+            find_games_ann(game_df, row, *filters, store=store, ann=ann)
+            t2 = time.perf_counter()
+            exact_t.append(t1 - t0)
+            ann_t.append(t2 - t1)
+
+            # a query with a missing numeric value is NaN to every game, as with gower_matrix;
+            # distances are discrete (mostly 0/1 features), so a neighbour counts as found when
+            # it is at least as close as the exact 10th neighbour, whichever of the tied games it is
+            mask = store.filter_mask(q, *filters)
+            exact_dist = np.sort(store.distances(q, mask)[mask])[:11]
+            if len(exact_dist) == 11 and not np.isnan(exact_dist[-1]):
+                _, ann_dist = ann.search(q, mask, 11)
+                recalls.append(np.mean(ann_dist <= exact_dist[-1] + 1e-6))
+        e50, e95 = _ms(exact_t)
+        a50, a95 = _ms(ann_t)
+        print(f"{label:24s} {statistics.mean(recalls):10.3f} {e50:8.2f}/{e95:<9.2f} {a50:7.2f}/{a95:<8.2f}")
+
+
+if __name__ == "__main__":
+    main()
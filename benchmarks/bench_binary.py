@@ -0,0 +1,86 @@
+"""Packed binary columns vs float32 columns in the Gower pass, on synthetic catalogues.
+
+    python -m benchmarks.bench_binary --rows 10000 100000 500000 --queries 50
+
+Builds the FeatureStore both ways: "packed" keeps the two-valued one-hot columns as
+uint64 bitsets compared with XOR and popcount, "float32" keeps every numeric column in
+the float32 matrix. Reported per catalogue and filter set: the p50 of one distances()
+call and of a distances_many() batch, the feature memory of each store, the largest
+distance difference between the two (float32 rounding only) and how many queries get a
+top-k list that is not equally near (ties at the k-th distance may still swap rows).
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_catalogue
+from recommender import TOP_K, FeatureStore, top_k
+
+# (year, player, rating, rated), as the page passes them
+FILTERS = {
+    "none": (None, None, None, None),
+    "page default": (None, None, None, 100),
+    "all filters": (2010, 4, 7, 1000),
+}
+
+
+def _p50_ms(fn, args):
+    samples = []
+    for a in args:
+        started = time.perf_counter()
+        fn(*a)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e3
+
+
+def feature_bytes(store):
+    return store.num.nbytes + store.bits.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=16, help="query rows per distances_many call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8s} {'filters':13s} {'float32 ms':>11s} {'packed ms':>10s} {'speedup':>8s} "
+          f"{'batch f32':>10s} {'batch pkd':>10s} {'max diff':>9s} {'top-k diff':>10s}")
+    for n in args.rows:
+        game_df = make_catalogue(n, args.seed)
+        packed = FeatureStore(game_df)
+        dense = FeatureStore(game_df, pack_binary=False)
+        queries = np.random.default_rng(args.seed + 1).choice(n, min(args.queries, n), replace=False)
+
+        for label, filters in FILTERS.items():
+            masks = [packed.filter_mask(q, *filters) for q in queries]
+            dense_ms = _p50_ms(dense.distances, list(zip(queries, masks)))
+            packed_ms = _p50_ms(packed.distances, list(zip(queries, masks)))
+
+            batches = [queries[i:i + args.batch] for i in range(0, len(queries), args.batch)]
+            dense_scales = [[dense.scale_for(q, packed.filter_mask(q, *filters)) for q in b] for b in batches]
+            packed_scales = [[packed.scale_for(q, packed.filter_mask(q, *filters)) for q in b] for b in batches]
+            batch_dense_ms = _p50_ms(dense.distances_many, list(zip(batches, dense_scales)))
+            batch_packed_ms = _p50_ms(packed.distances_many, list(zip(batches, packed_scales)))
+
+            diff, topk_diff = 0.0, 0
+            for q, mask in zip(queries, masks):
+                a, b = dense.distances(q, mask), packed.distances(q, mask)
+                finite = np.isfinite(a) & np.isfinite(b)
+                if finite.any():
+                    diff = max(diff, float(np.abs(a[finite] - b[finite]).max()))
+                # rows tied at the k-th distance may swap, so the picked distances are compared
+                picked_a, picked_b = a[top_k(a, TOP_K + 1, mask)], a[top_k(b, TOP_K + 1, mask)]
+                topk_diff += not np.allclose(picked_a, picked_b, rtol=0, atol=1e-6, equal_nan=True)
+
+            print(f"{n:8d} {label:13s} {dense_ms:11.2f} {packed_ms:10.2f} {dense_ms / packed_ms:7.1f}x "
+                  f"{batch_dense_ms:10.1f} {batch_packed_ms:10.1f} {diff:9.1e} {topk_diff:10d}")
+        print(f"{n:8d} features: {packed.n_binary} binary columns packed into {packed.bits.shape[1]} words, "
+              f"{feature_bytes(dense) / 2 ** 20:.1f} MB float32 -> {feature_bytes(packed) / 2 ** 20:.1f} MB packed")
+
+
+if __name__ == "__main__":
+    main()
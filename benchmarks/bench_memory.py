@@ -0,0 +1,127 @@
+"""Memory per replica: default-dtype DataFrames with per-request copies vs the compact,
+shared catalogue.
+
+    python -m benchmarks.bench_memory --rows 100000 --sessions 1 8 32
+
+Each mode runs in a fresh process. "legacy" reads game_df.csv with default dtypes and
+every session filters and drops its own copy of the frame, as find_games did with
+gower_matrix. "compact" loads the frame once through the shared snapshot loader, builds
+the FeatureStore and every session runs find_games against it (the Parquet snapshot is
+prepared beforehand, as on a warm replica). All sessions hold their working set at the
+same time, as concurrent reruns would. RSS is reported after imports, after loading and
+with every session live.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+import fsspec
+import pandas as pd
+
+from benchmarks.synthetic import make_catalogue
+from data_loader import SnapshotLoader
+
+FILTERS = (2010, 2, None, 100)
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def _peak_mb():
+    # VmHWM rather than ru_maxrss, which a spawned child inherits from its parent
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def _sessions(n, work):
+    barrier = threading.Barrier(n + 1)
+    held = [None] * n
+
+    def session(i):
+        held[i] = work(i)
+        barrier.wait()   # everyone holds their working set
+        barrier.wait()   # until the measurement is taken
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    rss = _rss_mb()
+    barrier.wait()
+    for t in threads:
+        t.join()
+    return rss
+
+
+def _legacy(data_dir, sessions):
+    from recommender import NON_FEATURE_COLS
+
+    started = _rss_mb()
+    df = pd.read_csv(os.path.join(data_dir, "game_df.csv"))
+    loaded = _rss_mb()
+
+    def work(i):
+        year, player, rating, rated = FILTERS
+        rows = df[(df['year'] >= year) & (df['min_player'] <= player) & (df['max_player'] >= player)
+                  & (df['user_rating'] >= rated)]
+        query = df.iloc[[i]]
+        return pd.concat([query, rows]).drop(columns=NON_FEATURE_COLS)
+
+    return df, started, loaded, _sessions(sessions, work)
+
+
+def _compact(data_dir, sessions):
+    from data_loader import shared_loader
+    from recommender import FeatureStore, find_games
+
+    started = _rss_mb()
+    df = shared_loader(fsspec.filesystem("file"), data_dir, os.path.join(data_dir, "cache")).load("game_df.csv")
+    store = FeatureStore(df)
+    loaded = _rss_mb()
+
+    def work(i):
+        return find_games(df, df.iloc[[i]], *FILTERS, store=store)
+
+    return df, started, loaded, _sessions(sessions, work)
+
+
+def _run(mode, data_dir, sessions, out):
+    df, started, loaded, held = (_legacy if mode == "legacy" else _compact)(data_dir, sessions)
+    out.put((df.memory_usage(deep=True).sum() / 2 ** 20, started, loaded, held, _peak_mb()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="bench-memory-")
+    try:
+        make_catalogue(args.rows).to_csv(os.path.join(data_dir, "game_df.csv"), index=False)
+        SnapshotLoader(fsspec.filesystem("file"), data_dir, os.path.join(data_dir, "cache")).load("game_df.csv")
+        ctx = multiprocessing.get_context("spawn")
+        print(f"{args.rows} games")
+        print(f"{'mode':8s} {'sessions':>8s} {'frame MB':>9s} {'start MB':>9s} {'loaded MB':>10s} "
+              f"{'sessions MB':>12s} {'peak MB':>8s}")
+        for sessions in args.sessions:
+            for mode in ("legacy", "compact"):
+                out = ctx.Queue()
+                proc = ctx.Process(target=_run, args=(mode, data_dir, sessions, out))
+                proc.start()
+                frame, started, loaded, held, peak = out.get()
+                proc.join()
+                print(f"{mode:8s} {sessions:8d} {frame:9.1f} {started:9.1f} {loaded:10.1f} {held:12.1f} {peak:8.1f}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Overview render benchmark: rebuilding figures on every rerun vs cached JSON specs
+vs figures parsed once from those specs.
+
+    python -m benchmarks.bench_overview --repeat 20
+
+"Render" is the work a rerun does per figure up to the JSON Streamlit sends to the
+browser, serialized the way st.plotly_chart does. The legacy path reads the CSV and
+builds the figure, the cached-spec path loads the stored spec and parses it into a
+Figure, and the cached-figure path (the page's) reuses a Figure parsed on the first
+rerun. Cold is the first rerun of a fresh cache directory, warm is the mean of the
+following reruns.
+"""
+import argparse
+import functools
+import json
+import shutil
+import statistics
+import tempfile
+import time
+
+import plotly.io as pio
+import plotly.utils
+
+from overview_figures import FIGURES, FigureCache
+
+
+def _time(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def _send(figure):
+    # what st.plotly_chart does with a Figure
+    return json.dumps(figure.to_dict(), cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def legacy_render(cache):
+    for name in FIGURES:
+        _send(cache.build(name))
+
+
+def cached_render(cache):
+    for name in FIGURES:
+        _send(pio.from_json(cache.spec(name)))
+
+
+def figure_render(cache, figures):
+    for name in FIGURES:
+        version = cache.version(name)
+        if (name, version) not in figures:
+            figures[name, version] = pio.from_json(cache.spec(name, version))
+        _send(figures[name, version])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--dataset-dir", default="./dataset")
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="bench-figures-")
+    try:
+        cache = FigureCache(dataset_dir=args.dataset_dir, cache_dir=cache_dir)
+        # warm imports so neither path pays for them
+        legacy_render(cache)
+
+        results = {}
+        for label, render in (("before (rebuild per rerun)", legacy_render),
+                              ("cached spec, parsed per rerun", cached_render),
+                              ("after (cached figure)", functools.partial(figure_render, figures={}))):
+            shutil.rmtree(cache_dir)
+            cache = FigureCache(dataset_dir=args.dataset_dir, cache_dir=cache_dir)
+            cold = _time(lambda: render(cache))
+            warm = [_time(lambda: render(cache)) for _ in range(args.repeat)]
+            results[label] = (cold, statistics.mean(warm), statistics.quantiles(warm, n=20)[-1])
+
+        print("figure payload sizes:")
+        for name in FIGURES:
+            print(f"  {name:28s} {len(cache.spec(name)) / 1024:10.1f} KiB")
+        print()
+        print(f"{'':30s} {'cold ms':>10s} {'warm ms':>10s} {'warm p95 ms':>12s}")
+        for label, (cold, warm, p95) in results.items():
+            print(f"{label:30s} {cold * 1e3:10.1f} {warm * 1e3:10.1f} {p95 * 1e3:12.1f}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
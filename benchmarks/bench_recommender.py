@@ -0,0 +1,180 @@
+"""Recommender benchmark: find_games latency by stage, peak memory and scaling with
+catalogue size, on synthetic catalogues with the game_df schema.
+
+    python -m benchmarks.bench_recommender --rows 1000 10000 100000 500000 --queries 50
+    python -m benchmarks.bench_recommender --rows 1000 10000 --legacy --csv results.csv
+
+Stages of the current path: "filter" builds the filter mask, "distance" is the Gower pass
+over the catalogue, "top-k" the selection and family slicing. "end-to-end" times
+find_games as the page calls it, "store" the one-off FeatureStore build per catalogue.
+--legacy also times the original page implementation (frame filtering, gower.gower_matrix,
+full argsort) up to --legacy-max-rows, when the gower package is installed.
+
+Peak memory is the tracemalloc peak of one find_games call (numpy allocations included).
+The scaling summary fits latency ~ rows^b per filter set.
+"""
+import argparse
+import csv
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import make_catalogue
+from recommender import NON_FEATURE_COLS, TOP_K, FeatureStore, find_games, recommendations, top_k
+
+# the page's filter combinations: (year, player, rating, rated); the votes slider defaults to 100
+FILTERS = {
+    "none": (None, None, None, None),
+    "page default": (None, None, None, 100),
+    "2 players": (None, 2, None, 100),
+    "since 2015": (2015, None, None, 100),
+    "rating 7+": (None, None, 7, 100),
+    "all filters": (2010, 4, 7, 1000),
+}
+
+
+def _ms(samples):
+    return statistics.median(samples) * 1e3
+
+
+def _p95(samples):
+    return (statistics.quantiles(samples, n=20)[-1] if len(samples) > 1 else samples[0]) * 1e3
+
+
+def current_stages(game_df, store, q, filters):
+    """Per-stage seconds of one find_games call, split the way find_games runs it."""
+    t0 = time.perf_counter()
+    mask = store.filter_mask(q, *filters)
+    t1 = time.perf_counter()
+    dist = store.distances(q, mask)
+    t2 = time.perf_counter()
+    idx = top_k(dist, TOP_K + 1, mask)
+    recommendations(game_df, store, q, idx, dist[idx])
+    t3 = time.perf_counter()
+    return {"filter": t1 - t0, "distance": t2 - t1, "top-k": t3 - t2}
+
+
+def legacy_stages(game_df, q, filters):
+    """Per-stage seconds of the original page's find_games (gower_matrix over a filtered copy)."""
+    import gower
+
+    selected_year, selected_player, selected_rating, selected_rated = filters
+    selected_row = game_df.iloc[[q]]
+    t0 = time.perf_counter()
+    fam = selected_row['family_group'].iloc[0]
+    df = game_df
+    if fam != " ":
+        df = df[df['family_group'] != fam]
+    if selected_player:
+        df = df[(df['min_player'] <= selected_player) & (df['max_player'] >= selected_player)]
+    if selected_year:
+        df = df[df['year'] >= selected_year]
+    if selected_rating:
+        df = df[df['avg_rating_group'] >= selected_rating]
+    if selected_rated:
+        df = df[df['user_rating'] >= selected_rated]
+    df = df.drop(columns=NON_FEATURE_COLS)
+    row = selected_row.drop(columns=NON_FEATURE_COLS)
+    t1 = time.perf_counter()
+    sim_measure = gower.gower_matrix(df, row)
+    t2 = time.perf_counter()
+    sim_measure.flatten().argsort()[:TOP_K + 1]
+    t3 = time.perf_counter()
+    return {"filter": t1 - t0, "distance": t2 - t1, "top-k": t3 - t2}
+
+
+def peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _slope(rows, values):
+    # exponent b of latency ~ rows^b, from a least-squares fit in log-log space
+    if len(rows) < 2:
+        return float("nan")
+    return np.polyfit(np.log(rows), np.log(values), 1)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=50, help="query games per catalogue and filter set")
+    parser.add_argument("--filters", nargs="+", choices=list(FILTERS), default=list(FILTERS))
+    parser.add_argument("--legacy", action="store_true", help="also time the gower_matrix implementation")
+    parser.add_argument("--legacy-max-rows", type=int, default=100000)
+    parser.add_argument("--csv", help="write every result row to this CSV")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.legacy:
+        try:
+            import gower  # noqa: F401
+        except ImportError:
+            print("gower is not installed, skipping --legacy")
+            args.legacy = False
+
+    results = []
+    header = (f"{'rows':>8s} {'impl':7s} {'filters':13s} {'filter':>8s} {'distance':>9s} {'top-k':>7s} "
+              f"{'e2e p50':>8s} {'e2e p95':>8s} {'peak MB':>8s}")
+    print(header)
+    for n in args.rows:
+        game_df = make_catalogue(n, args.seed)
+        started = time.perf_counter()
+        store = FeatureStore(game_df)
+        store_s = time.perf_counter() - started
+        queries = np.random.default_rng(args.seed + 1).choice(n, min(args.queries, n), replace=False)
+
+        impls = ["current"] + (["legacy"] if args.legacy and n <= args.legacy_max_rows else [])
+        for impl in impls:
+            for label in args.filters:
+                filters = FILTERS[label]
+                stages, e2e = {"filter": [], "distance": [], "top-k": []}, []
+                for q in queries:
+                    if impl == "current":
+                        split = current_stages(game_df, store, q, filters)
+                        t0 = time.perf_counter()
+                        find_games(game_df, game_df.iloc[[q]], *filters, store=store)
+                        e2e.append(time.perf_counter() - t0)
+                    else:
+                        split = legacy_stages(game_df, q, filters)
+                        e2e.append(sum(split.values()))
+                    for stage, seconds in split.items():
+                        stages[stage].append(seconds)
+
+                q = queries[0]
+                if impl == "current":
+                    peak = peak_bytes(lambda: find_games(game_df, game_df.iloc[[q]], *filters, store=store))
+                else:
+                    peak = peak_bytes(lambda: legacy_stages(game_df, q, filters))
+                row = {"rows": n, "impl": impl, "filters": label, "store_s": store_s,
+                       "filter_ms": _ms(stages["filter"]), "distance_ms": _ms(stages["distance"]),
+                       "topk_ms": _ms(stages["top-k"]), "e2e_p50_ms": _ms(e2e), "e2e_p95_ms": _p95(e2e),
+                       "peak_mb": peak / 2 ** 20}
+                results.append(row)
+                print(f"{n:8d} {impl:7s} {label:13s} {row['filter_ms']:8.2f} {row['distance_ms']:9.2f} "
+                      f"{row['topk_ms']:7.2f} {row['e2e_p50_ms']:8.2f} {row['e2e_p95_ms']:8.2f} {row['peak_mb']:8.1f}")
+        print(f"{n:8d} store built in {store_s * 1e3:.0f} ms")
+
+    print("\nscaling exponent b of p50 latency ~ rows^b")
+    for impl in ("current", "legacy"):
+        for label in args.filters:
+            points = [(r["rows"], r["e2e_p50_ms"]) for r in results if r["impl"] == impl and r["filters"] == label]
+            if len(points) > 1:
+                rows, values = zip(*points)
+                print(f"    {impl:7s} {label:13s} b = {_slope(rows, values):.2f}")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    main()
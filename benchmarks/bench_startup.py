@@ -0,0 +1,146 @@
+"""Cold-start cost of each page: its first render in a fresh process, and the
+-X importtime profile of its module-level imports.
+
+    python -m benchmarks.bench_startup --repeat 5 --top 10
+    python -m benchmarks.bench_startup --max-ms 1500     # exit 1 when a page gets slower
+
+The first render runs the whole page script once, through the load-test harness, in a
+new interpreter against the synthetic bucket and reviews database of load_test.py. That
+is what a new replica does for the first session that opens the page, including the
+imports done inside functions on the path the page takes. The local snapshots and figure
+specs are built by an untimed run first, as a replica finds them already on disk.
+
+The import profile runs only the page's module-level imports with -X importtime, to show
+where that part of the time goes. Imports that fail there (packages not installed) are
+listed, so a partial environment does not pass for a fast one.
+"""
+import argparse
+import ast
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.load_test import ROOT, make_fixtures
+
+PAGES = ["Overview.py", "pages/0_Recommender.py", "pages/1_Board_Game_Reviews.py"]
+
+PROBE = """
+import sys, time
+failed = []
+started = time.perf_counter()
+for statement in {statements!r}:
+    try:
+        exec(statement, {{}})
+    except Exception as e:
+        failed.append(statement + "  # " + type(e).__name__)
+print(time.perf_counter() - started)
+for line in failed:
+    print(line)
+"""
+
+RENDER = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from benchmarks.load_test import Harness
+tree, seconds, error = Harness().run({page!r})
+print(time.perf_counter() - started, seconds, len(sys.modules), error or "")
+"""
+
+
+def module_imports(path):
+    """The page's top-level import statements, as source lines."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def profile(statements):
+    """(seconds, failed imports, {module: cumulative us}) of one cold run."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE.format(statements=statements)],
+                            capture_output=True, text=True, check=True)
+    lines = result.stdout.splitlines()
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum_us, name = line[len("import time:"):].split("|")
+        # keep the indentation, it tells nested imports from the ones the page asked for
+        cumulative[name[1:].rstrip()] = int(cum_us)
+    return float(lines[0]), lines[1:], cumulative
+
+
+def first_render(page, env):
+    """(seconds, script seconds, modules loaded, error) of page's first run in a fresh
+    process. seconds also counts importing streamlit and starting its runtime."""
+    result = subprocess.run([sys.executable, "-c", RENDER.format(root=ROOT, page=page)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    seconds, script, modules, error = (result.stdout.strip().splitlines()[-1].split(" ", 3) + [""])[:4]
+    return float(seconds), float(script), int(modules), error
+
+
+def fixtures_env(path, rows, review_games):
+    """The environment pointing the pages at load_test.py's synthetic fixtures under path."""
+    bucket, db = make_fixtures(path, rows, review_games, 50)
+    return dict(os.environ, BOARDGAMEWHIZ_LOCAL_BUCKET=bucket, BOARDGAMEWHIZ_REVIEWS_SQLITE=db,
+                BOARDGAMEWHIZ_REVIEW_STORE=os.path.join(path, "no-review-store"))
+
+
+def _top_level(cumulative, startup):
+    # -X importtime indents nested imports, the unindented names are the ones the page asked
+    # for (minus what the interpreter itself loads at startup)
+    return {name: us for name, us in cumulative.items() if not name.startswith(" ") and name not in startup}
+
+
+def report(page, env, startup, args):
+    """Prints the page's timings, True when its first render fails or is over --max-ms."""
+    first_render(page, env)
+    renders = [first_render(page, env) for _ in range(args.repeat)]
+    render_ms = statistics.median(r[0] for r in renders) * 1e3
+    script_ms = statistics.median(r[1] for r in renders) * 1e3
+    _, _, modules, error = renders[-1]
+    print(f"{page}: first render {render_ms:.0f} ms median over {args.repeat} fresh processes "
+          f"({script_ms:.0f} ms in the page script), {modules} modules loaded"
+          + (f", failed: {error}" if error else ""))
+
+    runs = [profile(module_imports(os.path.join(ROOT, page))) for _ in range(args.repeat)]
+    median_ms = statistics.median(r[0] for r in runs) * 1e3
+    _, failed, cumulative = runs[-1]
+    print(f"    module-level imports alone: {median_ms:.0f} ms, {len(set(cumulative) - startup)} modules")
+    top = sorted(_top_level(cumulative, startup).items(), key=lambda item: -item[1])[:args.top]
+    for name, us in top:
+        print(f"    {us / 1e3:8.1f} ms  {name.strip()}")
+    for statement in failed:
+        print(f"    not importable here: {statement}")
+    return bool(error) or (args.max_ms is not None and render_ms > args.max_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", default=PAGES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports listed per page")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="fail when a page's median first render exceeds this")
+    parser.add_argument("--rows", type=int, default=20000, help="games in the synthetic catalogue")
+    parser.add_argument("--review-games", type=int, default=500)
+    args = parser.parse_args()
+
+    startup = set(profile([])[2])
+    path = tempfile.mkdtemp(prefix="boardgamewhiz-startup-")
+    try:
+        env = fixtures_env(path, args.rows, args.review_games)
+        slow = [page for page in args.pages if report(page, env, startup, args)]
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    if slow:
+        print(f"failed or over {args.max_ms or 0:.0f} ms: {', '.join(slow)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
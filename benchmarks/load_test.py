@@ -0,0 +1,409 @@
+"""Offline load test: many concurrent simulated sessions driving the three pages in one
+process, as one replica.
+
+    python -m benchmarks.load_test --sessions 16 --duration 60
+    python -m benchmarks.load_test --sessions 4 --mix overview=1,recommender=3,reviews=2
+
+Pages run headlessly through Streamlit's script-runner test harness (streamlit.testing,
+the predecessor of AppTest in the pinned 1.27). GCS and BigQuery are replaced by local
+stand-ins through the pages' own switches: BOARDGAMEWHIZ_LOCAL_BUCKET points the snapshot
+loader at a directory of synthetic CSVs, and BOARDGAMEWHIZ_REVIEWS_SQLITE serves reviews
+from a synthetic SQLite copy of the reviews table.
+
+Every session replays interaction scripts picked by --mix weights: Overview is one load,
+the Recommender searches and selects a game, sets the player filter and runs, the Reviews
+page searches and selects a game, picks a sentiment, retrieves and pages forward twice.
+"review search" (with --review-store) also types review keywords before retrieving.
+Each rerun is timed from script start to script stop. Reported: p50/p95/p99 per step,
+reruns per second, errors and RSS.
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_catalogue
+from memory_trace import rss_bytes
+from review_facets import FACETS_FILE, build_facets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = {
+    "overview": "Overview.py",
+    "recommender": "pages/0_Recommender.py",
+    "reviews": "pages/1_Board_Game_Reviews.py",
+    "review search": "pages/1_Board_Game_Reviews.py",
+}
+
+SENTIMENTS = ["Positive", "Negative", "Neutral-Positive", "Neutral-Negative"]
+
+# phrases the synthetic reviews contain, and one they never do
+KEYWORDS = ["replay value", "fun game", "lot", "solo mode"]
+
+
+def make_fixtures(path, rows, review_games, reviews_per_game, seed = 0):
+    """Synthetic bucket directory and reviews database under path."""
+    rng = np.random.default_rng(seed)
+    bucket = os.path.join(path, "bucket")
+    os.makedirs(bucket, exist_ok=True)
+    game_df = make_catalogue(rows, seed)
+    game_df.to_csv(os.path.join(bucket, "game_df.csv"), index=False)
+    info = game_df[['bgg_id', 'name', 'year', 'image']].iloc[:review_games]
+    info.to_csv(os.path.join(bucket, "game_info_reviews.csv"), index=False)
+
+    n = len(info) * reviews_per_game
+    ratings = rng.integers(1, 11, n)
+    reviews = pd.DataFrame({
+        'bgg_id': np.repeat(info['bgg_id'].to_numpy(), reviews_per_game),
+        'name': np.repeat(info['name'].to_numpy(), reviews_per_game),
+        'rating': ratings.astype(float),
+        'rating_group': ratings,
+        'comment': [f"Review {i}: " + "fun game with a lot of replay value. " * int(k)
+                    for i, k in enumerate(rng.integers(1, 12, n))],
+        'final_sentiment': rng.choice(SENTIMENTS, n),
+        'subjectivity': rng.random(n),
+        'label_proba': rng.random(n),
+    })
+    build_facets(reviews).to_csv(os.path.join(bucket, FACETS_FILE), index=False)
+    db = os.path.join(path, "reviews.db")
+    with sqlite3.connect(db) as conn:
+        reviews.to_sql("reviews", conn, index=False, if_exists="replace")
+        conn.execute("create index reviews_query on reviews (bgg_id, final_sentiment, label_proba)")
+    return bucket, db
+
+
+class Harness:
+    """Runs page scripts in-process with Streamlit's test script runner."""
+
+    def __init__(self, timeout = 60):
+        from unittest.mock import MagicMock
+
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+        from streamlit.runtime.media_file_manager import MediaFileManager
+        from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+        from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+        # the same minimal runtime streamlit.testing's own script tests set up
+        runtime = MagicMock(spec=Runtime)
+        runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+        runtime.cache_storage_manager = MemoryCacheStorageManager()
+        Runtime._instance = runtime
+        # one bytecode cache for all sessions, as the server's runtime has
+        self.script_cache = ScriptCache()
+        self.timeout = timeout
+
+    def page_hash(self, script):
+        from streamlit import source_util
+
+        path = os.path.join(ROOT, script)
+        for page_hash, page in source_util.get_pages(os.path.join(ROOT, PAGES["overview"])).items():
+            if os.path.samefile(page["script_path"], path):
+                return page_hash
+        raise LookupError(f"{script} is not a page of the app")
+
+    def run(self, script, tree = None):
+        """Rerun script (after the widget changes made on tree), as (tree, seconds, error)."""
+        from streamlit.runtime.scriptrunner import RerunData, ScriptRunnerEvent
+        from streamlit.testing.element_tree import parse_tree_from_messages
+        from streamlit.testing.local_script_runner import LocalScriptRunner
+
+        stopped = (ScriptRunnerEvent.SCRIPT_STOPPED_WITH_SUCCESS,
+                   ScriptRunnerEvent.SCRIPT_STOPPED_WITH_COMPILE_ERROR,
+                   ScriptRunnerEvent.SCRIPT_STOPPED_FOR_RERUN)
+        times = {}
+        done = threading.Event()
+
+        def timed(sender, event, **kwargs):
+            if event == ScriptRunnerEvent.SCRIPT_STARTED:
+                times["start"] = time.perf_counter()
+            elif event in stopped:
+                times["stop"] = time.perf_counter()
+                done.set()
+
+        # a multipage app always runs from its main script, the page is picked by its hash
+        runner = LocalScriptRunner(os.path.join(ROOT, PAGES["overview"]), tree.session_state if tree else None)
+        runner._script_cache = self.script_cache
+        runner.on_event.connect(timed, weak=False)
+        runner.request_rerun(RerunData(widget_states=_widget_states(tree) if tree else None,
+                                       page_script_hash=self.page_hash(script)))
+        runner.start()
+        if not done.wait(self.timeout):
+            runner.request_stop()
+            runner.join()
+            return tree, self.timeout, "timeout"
+        runner.join()
+
+        result = parse_tree_from_messages(runner.forward_msgs())
+        result.script_path = runner.script_path
+        result._session_state = runner.session_state
+        exceptions = result.get("exception")
+        error = exceptions[0].value.splitlines()[0] if exceptions else None
+        return result, times["stop"] - times["start"], error
+
+
+def _widget_states(tree):
+    """tree.get_widget_states(), less the widgets whose state it cannot serialize: a select
+    box with a format_func holds a raw value the element tree cannot find among the
+    formatted options. Those are only ever ones no action changed (actions pick from the
+    options), and left out they keep their value from the last rerun, as in a browser."""
+    from streamlit.proto.WidgetStates_pb2 import WidgetStates
+
+    states = WidgetStates()
+    for node in tree:
+        try:
+            state = node.widget_state()
+        except ValueError:
+            continue
+        if state is not None:
+            states.widgets.append(state)
+    return states
+
+
+def _widget(tree, kind, label):
+    for widget in tree.get(kind):
+        if widget.label.startswith(label):
+            return widget
+    raise LookupError(f"no {kind} labelled {label!r}")
+
+
+def _click(kind, label):
+    def action(tree):
+        _widget(tree, kind, label).click()
+    return action
+
+
+def _select(label, options):
+    def action(tree):
+        _widget(tree, "selectbox", label).set_value(options())
+    return action
+
+
+def _search(label, names):
+    # type a game's name into the search box; the select box then offers the matches
+    def action(tree):
+        _widget(tree, "text_input", f"Search {label}").set_value(names())
+    return action
+
+
+def _select_first(label):
+    def action(tree):
+        widget = _widget(tree, "selectbox", label)
+        if not widget.options:
+            raise LookupError(f"no matches offered in {label!r}")
+        widget.set_value(widget.options[0])
+    return action
+
+
+def _type(label, values):
+    def action(tree):
+        _widget(tree, "text_input", label).set_value(values())
+    return action
+
+
+def _select_labelled(label, values):
+    # options carry their review counts, "Positive (123)"
+    def action(tree):
+        widget = _widget(tree, "selectbox", label)
+        value = values()
+        widget.set_value(next(o for o in widget.options if o == value or o.startswith(value + " (")))
+    return action
+
+
+def _next_page(tree):
+    buttons = [b for b in tree.get("button") if b.label == "Next reviews" and not b.disabled]
+    if not buttons:
+        return False
+    buttons[0].click()
+
+
+# page -> steps of one visit: (step name, widget change made before the rerun, None for a fresh load)
+def overview(rng, games):
+    return [("load", None)]
+
+
+def recommender(rng, games):
+    return [("load", None),
+            ("search", _search("Board Game", lambda: rng.choice(games))),
+            ("select game", _select_first("Board Game")),
+            ("set filters", _select("Player Count", lambda: rng.choice([None, 1, 2, 3, 4]))),
+            ("run", _click("button", "Click Me to Run"))]
+
+
+def reviews(rng, games):
+    return [("load", None),
+            ("search", _search("Select Board Game", lambda: rng.choice(games))),
+            ("select game", _select_first("Select Board Game")),
+            ("select sentiment", _select_labelled("Select Sentiment", lambda: rng.choice(SENTIMENTS))),
+            ("retrieve", _click("button", "Click Me to Retrieve")),
+            ("next page", _next_page),
+            ("next page", _next_page)]
+
+
+def review_search(rng, games):
+    return [("load", None),
+            ("search", _search("Select Board Game", lambda: rng.choice(games))),
+            ("select game", _select_first("Select Board Game")),
+            ("select sentiment", _select_labelled("Select Sentiment", lambda: rng.choice(SENTIMENTS))),
+            ("keywords", _type("Reviews Mentioning", lambda: rng.choice(KEYWORDS))),
+            ("retrieve", _click("button", "Click Me to Retrieve")),
+            ("next page", _next_page)]
+
+
+SCENARIOS = {"overview": overview, "recommender": recommender, "reviews": reviews, "review search": review_search}
+
+
+def visit(harness, page, rng, games):
+    """Replay one visit of page, yielding (step, seconds, error) per rerun. A visit ends at
+    its first error."""
+    tree = None
+    for step, action in SCENARIOS[page](rng, games):
+        if action is not None:
+            try:
+                if action(tree) is False:
+                    return
+            except LookupError as e:
+                yield step, 0.0, str(e)
+                return
+        tree, seconds, error = harness.run(PAGES[page], tree if action is not None else None)
+        yield step, seconds, error
+        if error:
+            return
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown page {name!r} in --mix, expected {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def session(harness, mix, games, seed, deadline, results, lock):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        page = rng.choices(names, weights)[0]
+        for step, seconds, error in visit(harness, page, rng, games[page]):
+            with lock:
+                results.append((page, step, seconds, error))
+
+
+def _percentiles(samples):
+    if len(samples) < 2:
+        return samples * 3
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return q[49], q[94], q[98]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load after warm-up")
+    parser.add_argument("--mix", default="overview=1,recommender=2,reviews=2")
+    parser.add_argument("--rows", type=int, default=20000, help="games in the synthetic catalogue")
+    parser.add_argument("--review-games", type=int, default=500)
+    parser.add_argument("--reviews-per-game", type=int, default=400)
+    parser.add_argument("--review-store", action="store_true",
+                        help="serve reviews from an indexed local review store instead of SQLite "
+                             "(needed for the 'review search' scenario)")
+    parser.add_argument("--no-warmup", action="store_true", help="include the cold first loads in the results")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    mix = _parse_mix(args.mix)
+    if "review search" in mix and not args.review_store:
+        raise SystemExit("the 'review search' scenario needs --review-store")
+
+    path = tempfile.mkdtemp(prefix="boardgamewhiz-load-")
+    try:
+        bucket, db = make_fixtures(path, args.rows, args.review_games, args.reviews_per_game, args.seed)
+        os.environ["BOARDGAMEWHIZ_LOCAL_BUCKET"] = bucket
+        os.environ["BOARDGAMEWHIZ_REVIEWS_SQLITE"] = db
+        os.environ["BOARDGAMEWHIZ_REVIEW_STORE"] = os.path.join(path, "no-review-store")
+        if args.review_store:
+            from review_search import build_search_index
+            from review_store import export_store
+
+            store = os.environ["BOARDGAMEWHIZ_REVIEW_STORE"] = os.path.join(path, "review-store")
+            with sqlite3.connect(db) as conn:
+                export_store(pd.read_sql_query("select * from reviews", conn), store)
+            build_search_index(store)
+        os.chdir(ROOT)
+
+        harness = Harness()
+        # game labels as the pages list them
+        from catalogue import CatalogueIndex
+        games = {"overview": [],
+                 "recommender": CatalogueIndex(pd.read_csv(os.path.join(bucket, "game_df.csv"))).labels,
+                 "reviews": CatalogueIndex(pd.read_csv(os.path.join(bucket, "game_info_reviews.csv"))).labels}
+        games["review search"] = games["reviews"]
+
+        rss = {"start": rss_bytes(), "samples": []}
+        results, lock = [], threading.Lock()
+        if not args.no_warmup:
+            warm = []
+            for page in mix:
+                for _, _, error in visit(harness, page, random.Random(args.seed), games[page]):
+                    if error:
+                        warm.append(f"{page}: {error}")
+            for error in warm:
+                print(f"warm-up error: {error}")
+        rss["warm"] = rss_bytes()
+
+        stop = threading.Event()
+
+        def sample_rss():
+            while not stop.wait(0.2):
+                rss["samples"].append(rss_bytes())
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        threads = [threading.Thread(target=session, args=(harness, mix, games, args.seed + i, deadline, results, lock))
+                   for i in range(args.sessions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    by_step = defaultdict(list)
+    errors = defaultdict(int)
+    for page, step, seconds, error in results:
+        if error:
+            errors[(page, error)] += 1
+        else:
+            by_step[(page, step)].append(seconds)
+
+    print(f"{args.sessions} sessions for {elapsed:.0f}s, mix {args.mix}, {args.rows} games")
+    print(f"{'page':13s} {'step':17s} {'reruns':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s}")
+    for (page, step), samples in sorted(by_step.items(), key=lambda item: list(PAGES).index(item[0][0])):
+        p50, p95, p99 = _percentiles(samples)
+        print(f"{page:13s} {step:17s} {len(samples):7d} {p50 * 1e3:8.1f} {p95 * 1e3:8.1f} {p99 * 1e3:8.1f}")
+    total = sum(len(s) for s in by_step.values())
+    print(f"throughput: {total / elapsed:.1f} reruns/s, {sum(errors.values())} errors")
+    for (page, error), count in errors.items():
+        print(f"    {count:5d} x {page}: {error}")
+    samples = rss["samples"] or [rss_bytes()]
+    print(f"RSS per replica: {rss['start'] / 2 ** 20:.0f} MB at start, {rss['warm'] / 2 ** 20:.0f} MB warm, "
+          f"{statistics.mean(samples) / 2 ** 20:.0f} MB mean / {max(samples) / 2 ** 20:.0f} MB peak under load")
+
+
+if __name__ == "__main__":
+    main()
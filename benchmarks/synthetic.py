@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+# one-hot flag columns, like the cat_* / mechanic columns of game_df
+N_CATEGORIES = 60
+N_MECHANICS = 40
+
+# latent game styles that tie flags and numeric features together, as in the real catalogue
+N_STYLES = 50
+
+
+def make_catalogue(n, seed = 0):
+    """Synthetic catalogue with the game_df schema: display and filter columns, numeric
+    features with a few missing values, categorical features and binary one-hot flags.
+
+    Each game is drawn from one of N_STYLES latent styles, so similar games exist the way
+    they do on BoardGameGeek instead of every game being uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    style = rng.integers(0, N_STYLES, n)
+    style_weight = rng.uniform(1, 5, N_STYLES)
+    style_flags = rng.beta(0.3, 3, (N_STYLES, N_CATEGORIES + N_MECHANICS))
+    min_player = rng.choice([1, 1, 2, 2, 2, 3], n)
+    df = pd.DataFrame({
+        'bgg_id': np.arange(n) + 1,
+        'name': [f"Game {i}" for i in range(n)],
+        'year': rng.integers(1990, 2024, n),
+        'image': [f"https://cf.geekdo-images.com/{i}.jpg" for i in range(n)],
+        'thumbnail': [f"https://cf.geekdo-images.com/{i}_t.jpg" for i in range(n)],
+        'link': [f"https://boardgamegeek.com/boardgame/{i + 1}" for i in range(n)],
+        # most games have no family, the rest come in small families
+        'family_group': np.where(rng.random(n) < 0.7, " ", [f"Family {i}" for i in rng.integers(0, n // 5 + 1, n)]),
+        'avg_rating': rng.uniform(3, 9, n).round(3),
+        'user_rating': rng.pareto(1.2, n).astype(int) * 50,
+        'min_player': min_player,
+        'max_player': min_player + rng.integers(0, 6, n),
+        'min_playtime': rng.choice([15, 30, 45, 60, 90, 120], n),
+        'max_playtime': rng.choice([30, 60, 90, 120, 180, 240], n),
+        'min_age': rng.choice([6, 8, 10, 12, 14, 16], n),
+        'avg_weights': np.clip(style_weight[style] + rng.normal(0, 0.4, n), 1, 5).round(2),
+        'mode': rng.choice(['Competitive', 'Cooperative', 'Team', 'Solo'], n),
+        'language_dependence': rng.choice(['None', 'Some', 'Moderate', 'Extensive'], n),
+    })
+    df['avg_rating_group'] = np.ceil(df['avg_rating']).astype(float)
+    df.loc[rng.random(n) < 0.02, 'avg_weights'] = np.nan
+    df.loc[rng.random(n) < 0.02, 'language_dependence'] = np.nan
+
+    names = [f"cat_{i}" for i in range(N_CATEGORIES)] + [f"mech_{i}" for i in range(N_MECHANICS)]
+    values = (rng.random((n, len(names))) < style_flags[style]).astype(np.int64)
+    flags = pd.DataFrame(values, columns=names)
+    return pd.concat([df, flags], axis=1)
@@ -0,0 +1,148 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+# matches returned per search, the most a select box is ever sent
+SEARCH_LIMIT = 20
+
+
+class CatalogueIndex:
+    """Name and bgg_id lookups over a game DataFrame, built once per load.
+
+    Each game gets a display label: its name, or "name (year)" when several bgg_ids share
+    the name (falling back to "name (#bgg_id)" if the year does not tell them apart).
+    Rows repeating the same game are resolved to its first row.
+    """
+
+    def __init__(self, df):
+        names = df['name'].astype(str).to_numpy()
+        ids = df['bgg_id'].to_numpy()
+        years = df['year'].to_numpy() if 'year' in df.columns else np.full(len(df), None)
+
+        # first row of every distinct game, in catalogue order
+        first = ~pd.Series(list(zip(names, ids))).duplicated().to_numpy()
+        positions = np.flatnonzero(first)
+        dup_names = pd.Series(names[positions]).duplicated(keep=False).to_numpy()
+
+        labels = []
+        for pos, dup in zip(positions, dup_names):
+            labels.append(f"{names[pos]} ({_year(years[pos])})" if dup else names[pos])
+        collide = pd.Series(labels).duplicated(keep=False).to_numpy()
+        for i in np.flatnonzero(collide):
+            labels[i] = f"{names[positions[i]]} (#{ids[positions[i]]})"
+
+        self.df = df
+        self.labels = labels
+        self.by_label = dict(zip(labels, positions.tolist()))
+        self.by_id = {}
+        for pos in positions.tolist():
+            self.by_id.setdefault(ids[pos].item(), pos)
+        self.by_name = {}
+        for pos in positions.tolist():
+            self.by_name.setdefault(names[pos], pos)
+
+    def position(self, label):
+        """Row position of a display label (or plain name), None when unknown."""
+        pos = self.by_label.get(label)
+        if pos is None:
+            pos = self.by_name.get(label)
+        return pos
+
+    def position_of_id(self, bgg_id):
+        return self.by_id.get(int(bgg_id))
+
+    def row(self, label):
+        """The game's row as a Series, None when unknown."""
+        pos = self.position(label)
+        return None if pos is None else self.df.iloc[pos]
+
+
+class GameSearchIndex:
+    """Typeahead search over the display labels of a CatalogueIndex.
+
+    Labels are case-folded and split into word tokens; a query matches a game when every
+    query token is a prefix of one of its tokens. An exact name ranks first, then labels
+    starting with the whole query, then the other matches, each by popularity (user_rating,
+    catalogue order without it).
+    Sorted token and label lists make each query a few binary searches, however large
+    the catalogue.
+    """
+
+    def __init__(self, catalogue, popularity = None):
+        self.labels = catalogue.labels
+        self.by_label = catalogue.by_label
+        positions = np.array([catalogue.by_label[label] for label in self.labels], dtype=np.int64)
+        if popularity is None and 'user_rating' in catalogue.df.columns:
+            popularity = catalogue.df['user_rating']
+        if popularity is None:
+            order = np.arange(len(self.labels))
+        else:
+            votes = np.nan_to_num(np.asarray(popularity, dtype=np.float64)[positions], nan=-1)
+            order = np.argsort(-votes, kind='stable')
+        # rank 0 is the most popular game
+        self.rank = np.empty(len(self.labels), dtype=np.int64)
+        self.rank[order] = np.arange(len(self.labels))
+        self.popular = [self.labels[i] for i in order]
+
+        folded = [_fold(label) for label in self.labels]
+        by_label = sorted(range(len(folded)), key=folded.__getitem__)
+        self.folded = [folded[i] for i in by_label]
+        self.folded_ids = np.array(by_label, dtype=np.int64)
+
+        tokens = sorted((token, i) for i, text in enumerate(folded) for token in set(_tokens(text)))
+        self.tokens = [token for token, _ in tokens]
+        self.token_ids = np.array([i for _, i in tokens], dtype=np.int64)
+
+    def known(self, label):
+        """Whether label is a game of this catalogue; one remembered across a reload may not be."""
+        return label in self.by_label
+
+    @staticmethod
+    def _prefix_range(keys, prefix):
+        return bisect_left(keys, prefix), bisect_left(keys, prefix + "\U0010ffff")
+
+    def _best(self, ids, limit):
+        ids = np.unique(ids)
+        if len(ids) > limit:
+            ids = ids[np.argpartition(self.rank[ids], limit - 1)[:limit]]
+        return ids[np.argsort(self.rank[ids], kind='stable')]
+
+    def search(self, query, limit = SEARCH_LIMIT):
+        """Up to limit labels matching query, best first; the most popular games for an
+        empty query."""
+        text = _fold(query or "")
+        words = _tokens(text)
+        if not words:
+            return self.popular[:limit]
+
+        # exact name first, then names starting with the query, then token matches
+        lo, hi = self._prefix_range(self.folded, text)
+        exact = self._best(self.folded_ids[lo:bisect_right(self.folded, text)], limit)
+        starts = np.concatenate([exact, self._best(self.folded_ids[lo:hi], limit)])
+        starts = pd.unique(starts)[:limit]
+
+        found = None
+        for word in words:
+            lo, hi = self._prefix_range(self.tokens, word)
+            ids = np.unique(self.token_ids[lo:hi])
+            found = ids if found is None else np.intersect1d(found, ids, assume_unique=True)
+            if not len(found):
+                break
+        rest = self._best(np.setdiff1d(found, starts, assume_unique=True), limit - len(starts))
+        return [self.labels[i] for i in np.concatenate([starts, rest])]
+
+
+def _fold(text):
+    return " ".join(str(text).casefold().split())
+
+
+def _tokens(text):
+    return "".join(c if c.isalnum() else " " for c in text).split()
+
+
+def _year(year):
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return "?"
@@ -0,0 +1,174 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+# where replicas keep their local Parquet copies of the bucket CSVs
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "boardgamewhiz-snapshots")
+
+# a local directory standing in for the GCS bucket (offline runs, load tests); unset in production
+LOCAL_BUCKET = os.environ.get("BOARDGAMEWHIZ_LOCAL_BUCKET")
+
+# explicit parse dtypes per source file, so every load gives the same frame: long text
+# columns become Arrow strings, repeated labels become categoricals
+SCHEMAS = {
+    "game_df.csv": {
+        "dtype": {"name": str, "image": str, "thumbnail": str, "link": str, "family_group": str},
+        "categorical": ["family_group"],
+        "strings": ["name", "image", "thumbnail", "link"],
+    },
+    "game_info_reviews.csv": {
+        "dtype": {"name": str, "image": str},
+        "categorical": [],
+        "strings": ["name", "image"],
+    },
+    "review_facets.csv": {
+        "dtype": {"final_sentiment": str},
+        "categorical": ["final_sentiment"],
+        "strings": [],
+    },
+}
+
+# bumped whenever compact() changes, so older snapshots are rebuilt instead of reused
+SNAPSHOT_FORMAT = 2
+
+# other text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_RATIO = 0.5
+
+
+def _downcast(col):
+    if pd.api.types.is_bool_dtype(col):
+        return col
+    if pd.api.types.is_integer_dtype(col):
+        return pd.to_numeric(col, downcast='integer')
+    if pd.api.types.is_float_dtype(col):
+        # only when every value survives the round trip, so distances do not move
+        narrow = col.astype(np.float32)
+        if ((narrow.astype(np.float64) == col) | col.isna()).all():
+            return narrow
+    return col
+
+
+def compact(df, schema):
+    """Smallest lossless dtypes for a parsed CSV: the schema's categorical and Arrow string
+    columns, integers and exactly representable floats downcast, and low-cardinality text
+    columns as categoricals."""
+    for col in schema.get("categorical", []):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in schema.get("strings", []):
+        if col in df.columns:
+            df[col] = df[col].astype("string[pyarrow]")
+    for col in df.columns:
+        if df[col].dtype == object:
+            if df[col].nunique(dropna=True) <= CATEGORY_RATIO * len(df):
+                df[col] = df[col].astype("category")
+        else:
+            df[col] = _downcast(df[col])
+    return df
+
+
+def source_version(info):
+    """Version marker of a bucket object from its fsspec info: the etag/hash when the
+    filesystem has one, size and modification time otherwise (e.g. a local directory)."""
+    for key in ("etag", "ETag", "md5Hash", "generation"):
+        if info.get(key):
+            return str(info[key]).strip('"')
+    mtime = info.get("mtime", info.get("updated", info.get("LastModified", "")))
+    return f"{info.get('size', '')}-{mtime}"
+
+
+class SnapshotLoader:
+    """Loads bucket CSVs through a local Parquet snapshot that is only rebuilt when the
+    source object changes.
+
+    fs is any fsspec filesystem (FilesConnection.fs for GCS, fsspec.filesystem("file")
+    with a local directory as bucket for testing).
+    """
+
+    def __init__(self, fs, bucket, cache_dir = DEFAULT_CACHE_DIR, schemas = SCHEMAS):
+        self.fs = fs
+        self.bucket = bucket.rstrip("/")
+        self.cache_dir = cache_dir
+        self.schemas = schemas
+        self._frames = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, name):
+        stem = os.path.splitext(name)[0]
+        return (os.path.join(self.cache_dir, stem + ".parquet"),
+                os.path.join(self.cache_dir, stem + ".version.json"))
+
+    def version(self, name):
+        """Current version marker of name in the bucket (one metadata request)."""
+        return source_version(self.fs.info(f"{self.bucket}/{name}"))
+
+    def _snapshot_version(self, name):
+        parquet_path, marker_path = self._paths(name)
+        if not (os.path.exists(parquet_path) and os.path.exists(marker_path)):
+            return None
+        with open(marker_path) as f:
+            marker = json.load(f)
+        if marker.get("format") != SNAPSHOT_FORMAT:
+            return None
+        return marker.get("version")
+
+    def _materialize(self, name, version):
+        schema = self.schemas.get(name, {"dtype": None, "categorical": []})
+        with self.fs.open(f"{self.bucket}/{name}", "rb") as f:
+            df = compact(pd.read_csv(f, dtype=schema["dtype"]), schema)
+
+        # write then rename, so a concurrent reader never sees half a snapshot
+        parquet_path, marker_path = self._paths(name)
+        suffix = f".{os.getpid()}.tmp"
+        df.to_parquet(parquet_path + suffix, index=False)
+        os.replace(parquet_path + suffix, parquet_path)
+        with open(marker_path + suffix, "w") as f:
+            json.dump({"source": f"{self.bucket}/{name}", "version": version, "format": SNAPSHOT_FORMAT}, f)
+        os.replace(marker_path + suffix, marker_path)
+        return df
+
+    def load(self, name, version = None):
+        """DataFrame for name, reusing the in-memory frame or the local snapshot while the
+        bucket object is unchanged."""
+        if version is None:
+            version = self.version(name)
+        with self._lock:
+            cached = self._frames.get(name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            if self._snapshot_version(name) == version:
+                df = pd.read_parquet(self._paths(name)[0])
+                # Parquet keeps the string dtype but not its Arrow storage
+                for col in self.schemas.get(name, {}).get("strings", []):
+                    if col in df.columns:
+                        df[col] = df[col].astype("string[pyarrow]")
+            else:
+                df = self._materialize(name, version)
+            self._frames[name] = (version, df)
+            return df
+
+
+_loaders = {}
+_loaders_lock = threading.Lock()
+
+
+def local_filesystem():
+    """fsspec filesystem for LOCAL_BUCKET, used in place of the GCS connection."""
+    import fsspec
+    return fsspec.filesystem("file")
+
+
+def shared_loader(fs, bucket, cache_dir = DEFAULT_CACHE_DIR):
+    """The process-wide SnapshotLoader for bucket, so every page and session holds the
+    same in-memory frames. Callers must treat the frames as read-only."""
+    key = (bucket.rstrip("/"), cache_dir)
+    with _loaders_lock:
+        loader = _loaders.get(key)
+        if loader is None:
+            loader = _loaders[key] = SnapshotLoader(fs, bucket, cache_dir)
+        return loader
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# set MEMORY_TRACE=1 to trace Python/numpy allocations as well as RSS (slows every allocation)
+TRACE_ALLOCATIONS = os.environ.get("MEMORY_TRACE", "") not in ("", "0")
+
+# measurements kept for the debug panel
+HISTORY = 50
+
+
+def rss_bytes():
+    """Current resident set size of this process, 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class MemoryTrace:
+    """Per-rerun memory measurements of the pages' hot paths.
+
+    Every measured block records the RSS before and after it. With allocation tracing on,
+    the tracemalloc peak within the block and its largest allocation sites are recorded too.
+    tracemalloc is process-wide, so with concurrent sessions a block's peak also includes
+    what other sessions allocated meanwhile.
+    """
+
+    def __init__(self, trace_allocations = TRACE_ALLOCATIONS, history = HISTORY, top = 5):
+        self.trace_allocations = trace_allocations
+        self.top = top
+        self.records = deque(maxlen=history)
+        self._lock = threading.Lock()
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def measure(self, label):
+        record = {"label": label, "rss_before": rss_bytes()}
+        tracing = self.trace_allocations and tracemalloc.is_tracing()
+        if tracing:
+            start_size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - started
+            record["rss_after"] = rss_bytes()
+            if tracing:
+                size, peak = tracemalloc.get_traced_memory()
+                record["allocated"] = size - start_size
+                record["peak"] = peak - start_size
+                stats = tracemalloc.take_snapshot().statistics("lineno")[:self.top]
+                record["top"] = [(str(s.traceback[0]), s.size) for s in stats]
+            with self._lock:
+                self.records.append(record)
+
+    def latest(self):
+        with self._lock:
+            return list(self.records)
+
+    @staticmethod
+    def describe(record):
+        """One log line for a measurement."""
+        text = (f"{record['label']}: {record['seconds'] * 1e3:.1f} ms, "
+                f"rss {record['rss_before'] / 2 ** 20:.1f} -> {record['rss_after'] / 2 ** 20:.1f} MB")
+        if "peak" in record:
+            text += f", traced peak {record['peak'] / 2 ** 20:.1f} MB"
+        return text
@@ -0,0 +1,145 @@
+"""Offline all-pairs nearest-neighbour index for the Recommender.
+
+Build it from a local (or gs://) copy of game_df.csv:
+
+    python neighbour_index.py game_df.csv dataset/neighbours --top-n 100 --workers 4
+
+The index is a directory of .npy files that are opened memory-mapped:
+bgg_id.npy (n,) int32 row keys, neighbours.npy (n, top_n) int32 neighbour bgg_ids and
+distances.npy (n, top_n) float32 Gower distances, nearest first. meta.json records the
+fingerprint of the FeatureStore it was built from (row order and every encoded feature
+value), so a stale index is never used against a new game_df.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from recommender import TOP_K, FeatureStore, find_games, init_worker_store, recommendations, top_k, worker_store
+from stage_trace import span
+
+DEFAULT_TOP_N = 100
+DEFAULT_BLOCK = 256
+
+def _build_block(args):
+    start, stop, top_n = args
+    store = worker_store()
+    dist = store.distances_many(np.arange(start, stop))
+    n = min(top_n, dist.shape[1])
+    ids = np.empty((stop - start, n), dtype=np.int32)
+    out = np.empty((stop - start, n), dtype=np.float32)
+    for i, row in enumerate(dist):
+        idx = top_k(row, n)
+        ids[i] = store.bgg_id[idx]
+        out[i] = row[idx]
+    return start, stop, ids, out
+
+
+def build_index(store, out_dir, top_n = DEFAULT_TOP_N, workers = None, block = DEFAULT_BLOCK):
+    """Compute the top_n Gower neighbours of every game in store and write them to out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    n = len(store)
+    top_n = min(top_n, n)
+
+    np.save(os.path.join(out_dir, "bgg_id.npy"), store.bgg_id.astype(np.int32))
+    ids = np.lib.format.open_memmap(os.path.join(out_dir, "neighbours.npy"), mode="w+",
+                                    dtype=np.int32, shape=(n, top_n))
+    dist = np.lib.format.open_memmap(os.path.join(out_dir, "distances.npy"), mode="w+",
+                                     dtype=np.float32, shape=(n, top_n))
+
+    blocks = [(start, min(start + block, n), top_n) for start in range(0, n, block)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_store, initargs=(store,)) as pool:
+        for start, stop, block_ids, block_dist in pool.map(_build_block, blocks):
+            ids[start:stop] = block_ids
+            dist[start:stop] = block_dist
+    ids.flush()
+    dist.flush()
+
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({"top_n": top_n,
+                   "n_features": store.n_features,
+                   "fingerprint": store.fingerprint(),
+                   "num_min": store.num_min.tolist(),
+                   "num_range": store.num_range.tolist()}, f)
+
+
+class NeighbourIndex:
+    """Read-only view of a built index, memory-mapped from disk."""
+
+    def __init__(self, path):
+        self.bgg_id = np.load(os.path.join(path, "bgg_id.npy"))
+        self.neighbours = np.load(os.path.join(path, "neighbours.npy"), mmap_mode="r")
+        self.distances = np.load(os.path.join(path, "distances.npy"), mmap_mode="r")
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.rows = pd.Index(self.bgg_id)
+
+    def is_compatible(self, store):
+        """True when the index was built from the same catalogue as store: same games in
+        the same order with the same feature values (indexes without a fingerprint never are)."""
+        return (self.meta["n_features"] == store.n_features
+                and self.meta.get("fingerprint") == store.fingerprint())
+
+    def lookup(self, store, pos, mask, n):
+        """The n nearest rows of pos that pass mask, as (positions, distances), or None
+        when the precomputed list cannot answer the query exactly."""
+        row = self.rows.get_indexer([store.bgg_id[pos]])[0]
+        if row < 0 or not store.ranges_unchanged(pos, mask):
+            return None
+        positions = store.positions_of(self.neighbours[row])
+        keep = positions >= 0
+        keep[keep] = mask[positions[keep]]
+        if keep.sum() < n:
+            return None
+        return positions[keep][:n], np.asarray(self.distances[row])[keep][:n]
+
+
+def load_index(path, store):
+    """NeighbourIndex at path, or None when it is missing or was built for another game_df."""
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    index = NeighbourIndex(path)
+    if not index.is_compatible(store):
+        return None
+    return index
+
+
+def find_games_indexed(game_df, selected_row, selected_year = None, selected_player = None, selected_rating = None,
+                       selected_rated = None, store = None, index = None, k = TOP_K, live = find_games):
+    """find_games answered from the neighbour index when it can be, by live (same signature
+    as find_games) otherwise."""
+    if store is not None and index is not None:
+        pos = store.position(selected_row.index[0])
+        with span("filter"):
+            mask = store.filter_mask(pos, selected_year, selected_player, selected_rating, selected_rated)
+        with span("index lookup"):
+            found = index.lookup(store, pos, mask, k + 1)
+        if found is not None:
+            idx, measure = found
+            return recommendations(game_df, store, pos, idx, measure, k)
+
+    return live(game_df, selected_row, selected_year, selected_player, selected_rating,
+                selected_rated, store=store, k=k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Recommender nearest-neighbour index.")
+    parser.add_argument("game_df", help="path or gs:// url of game_df.csv")
+    parser.add_argument("out_dir", help="directory to write the index to")
+    parser.add_argument("--top-n", type=int, default=DEFAULT_TOP_N)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--block", type=int, default=DEFAULT_BLOCK)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = FeatureStore(pd.read_csv(args.game_df))
+    build_index(store, args.out_dir, args.top_n, args.workers, args.block)
+    print(f"Indexed {len(store)} games in {time.perf_counter() - started:.1f}s -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
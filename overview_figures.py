@@ -0,0 +1,273 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+# plotly.express and plotly.graph_objects are imported inside the builders: a rerun that
+# only serves cached specs never needs them
+
+DATASET_DIR = "./dataset"
+
+# above this many games the scatter is thinned out server-side
+SCATTER_POINT_BUDGET = int(os.environ.get("BOARDGAMEWHIZ_SCATTER_POINT_BUDGET", "5000"))
+# most-voted games that always keep their full hover detail
+SCATTER_HOVER_TOP = int(os.environ.get("BOARDGAMEWHIZ_SCATTER_HOVER_TOP", "1000"))
+# "sample" keeps a stratified sample of the rest, "density" bins it into a heatmap
+SCATTER_MODE = os.environ.get("BOARDGAMEWHIZ_SCATTER_MODE", "sample")
+SCATTER_BINS = int(os.environ.get("BOARDGAMEWHIZ_SCATTER_BINS", "40"))
+
+# part of every figure version: bump it when the specs change in a way the builders' code
+# does not show, e.g. a plotly upgrade or a change to how specs are serialized
+FIGURE_FORMAT = 1
+
+# serialized figure specs, shared by every replica on the host
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "boardgamewhiz-figures")
+
+
+def line_chart(df_ratings_avg):
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    # df_ratings = df[['bgg_id', 'name', 'year', 'avg_rating']]
+    #df_ratings = df_ratings[(df_ratings['year'] >= 2000) & (df_ratings['year'] <= 2023)]
+    #df_ratings_avg = df_ratings.groupby('year')['avg_rating'].mean().reset_index()
+
+    # fig = px.line(df_ratings_avg, x="year", y="avg_rating",
+    #         labels={"year": "Year Published","avg_rating": "Avg User Rating"})
+
+    # fig.add_bar(x=df_ratings_avg["year"], y=df_ratings_avg["count_game"], name="Game Count")
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig2 = px.line(df_ratings_avg, x="year", y="avg_rating",
+             labels={"year": "Year Published","avg_rating": "Avg User Rating"})
+    for t in fig2.select_traces():
+        fig.add_trace(t, secondary_y = False)
+
+    fig.add_trace(go.Bar(x = df_ratings_avg["year"], y = df_ratings_avg["count_game"], name="Game Count"), secondary_y = True)
+    fig.update_yaxes(range=[4,6.8], secondary_y=False)
+    fig.update_yaxes(range=[1000,10000], showgrid=False, secondary_y=True)
+
+    fig.update_layout(legend=dict(
+    yanchor="top",
+    y=1.1,
+    xanchor="left",
+    x=0.01
+    ))
+    return fig
+
+
+def bar_chart(df_genre_rating):
+    import plotly.express as px
+
+    # df_genre = df[['bgg_id', 'name', 'year', 'avg_rating','avg_rating_group', 'abstracts', 'cgs', 'childrensgames', 'familygames', 'partygames', 'strategygames', 'thematic', 'wargames']].copy()
+    # df_genre = df_genre[df_genre['avg_rating'] > 0.00]
+    # df_genre = df_genre[['avg_rating_group','abstracts', 'cgs', 'childrensgames', 'familygames', 'partygames', 'strategygames', 'thematic', 'wargames']]
+    # genre_dict = {'abstracts': 'Abstract', 'cgs': 'Customizable', 'childrensgames': 'Children', 'familygames': 'Family', 'partygames': 'Party',
+    #         'strategygames': 'Strategy', 'thematic': 'Thematic', 'wargames': 'War'}
+    # df_genre = df_genre.rename(genre_dict, axis = 1)
+    # df_genre_rating = df_genre.groupby('avg_rating_group').sum().reset_index()
+    # df_genre_rating = pd.melt(df_genre_rating, id_vars=['avg_rating_group'])
+
+    fig = px.bar(df_genre_rating, x="avg_rating_group", y="value", color="variable",
+        labels={"avg_rating_group": "User Rating","value": "Game Count", "variable": "Genre"})
+
+    fig.update_layout(legend=dict(
+        yanchor="top",
+        y=0.99,
+        xanchor="left",
+        x=0.01
+    ))
+    return fig
+
+
+def scatter_chart(df_weights):
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    # df_weights = df[['bgg_id', 'name', 'year', 'avg_rating', 'avg_weights', 'user_rating']].copy()
+    # df_weights['avg_rating'] = df_weights['avg_rating'].round(2)
+    # df_weights['avg_weights'] = df_weights['avg_weights'].round(2)
+
+    # df_weights =  df_weights[df_weights['user_rating'] >= 1000]
+
+    labels = {"name":"Game","avg_weights": "Complexity","avg_rating": "Rating",'year':'Year','user_rating':'Votes'}
+    if len(df_weights) <= SCATTER_POINT_BUDGET:
+        return px.scatter(df_weights, x="avg_weights", y="avg_rating", opacity=0.5, hover_data=['name','year','user_rating'],
+                     labels=labels, render_mode="webgl")
+
+    # too many points for the browser: full detail for the most-voted games only
+    df_weights = df_weights.sort_values('user_rating', ascending=False)
+    top, rest = df_weights.iloc[:SCATTER_HOVER_TOP], df_weights.iloc[SCATTER_HOVER_TOP:]
+    fig = px.scatter(top, x="avg_weights", y="avg_rating", opacity=0.5, hover_data=['name','year','user_rating'],
+                 labels=labels, render_mode="webgl")
+
+    if SCATTER_MODE == "density":
+        # binned here, so only the bin counts go to the browser
+        rest = rest.dropna(subset=["avg_weights", "avg_rating"])
+        counts, x_edges, y_edges = np.histogram2d(rest["avg_weights"], rest["avg_rating"], bins=SCATTER_BINS)
+        fig.add_trace(go.Heatmap(z=np.where(counts > 0, counts, np.nan).T,
+                                 x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+                                 colorscale="Blues", showscale=False, hovertemplate="Games: %{z}<extra></extra>"))
+        # keep the detailed points on top of the density layer
+        fig.data = fig.data[::-1]
+    else:
+        sample = stratified_sample(rest, "avg_weights", "avg_rating", SCATTER_POINT_BUDGET - len(top))
+        fig.add_trace(go.Scattergl(x=sample["avg_weights"], y=sample["avg_rating"], mode="markers", opacity=0.3,
+                                   marker=dict(color=fig.data[0].marker.color), showlegend=False,
+                                   hovertemplate="Complexity: %{x}<br>Rating: %{y}<extra></extra>"))
+        fig.data = fig.data[::-1]
+    return fig
+
+
+def stratified_sample(df, x, y, n, bins = SCATTER_BINS, seed = 0):
+    """About n rows of df spread over a bins x bins grid of (x, y), every occupied cell keeping
+    at least one row so sparse regions and outliers stay visible."""
+    if len(df) <= n:
+        return df
+    cell = (pd.cut(df[x], bins, labels=False).fillna(-1).astype(int) * bins
+            + pd.cut(df[y], bins, labels=False).fillna(-1).astype(int))
+    counts = cell.value_counts()
+    quota = np.maximum(1, np.floor(counts * n / len(df))).astype(int)
+    rank = df.assign(_r=np.random.default_rng(seed).random(len(df))).groupby(cell)['_r'].rank(method='first')
+    return df[rank.to_numpy() <= cell.map(quota).to_numpy()]
+
+
+def heatmap(df_matrix):
+    import plotly.express as px
+
+    # #new_df = df[(df['year'] >= 2000) & (df['year'] <= 2023)].copy()
+    # new_df = df.copy()
+    # my_col = new_df.columns[new_df.columns.str.contains('cat_')].to_list()
+    # my_col.append('year')
+    # new_df = new_df[my_col]
+
+    # # top 1000 games
+    # df_test = new_df.iloc[:1000].copy()
+
+    # col_to_delete = df_test.sum(axis=0, numeric_only = True).reset_index().rename({0:'value'}, axis = 1)
+    # col_to_delete = col_to_delete[col_to_delete['value'] == 0.0]['index'].to_list()
+    # col_to_delete = [i for i in col_to_delete if 'cat_' in i]
+    # df_matrix = df_test.drop(columns=col_to_delete)
+
+    # df_matrix.columns = df_matrix.columns.str.replace("cat_","")
+    # df_matrix = df_matrix.rename({'Industry / Manufacturing': 'Industry'}, axis = 1)
+    # df_matrix = df_matrix.groupby('year').sum()
+    # game_idx = df_matrix.sum().reset_index()
+    # fifty_idx = game_idx[game_idx[0] > 50]
+
+    # df_matrix = df_matrix[fifty_idx['index']]
+
+    # aggregates.py writes the year alongside the counts
+    if 'year' in df_matrix.columns:
+        df_matrix = df_matrix.set_index('year')
+    fig = px.imshow(df_matrix.T, labels={"x":"Year","y": "Category",'color':'Count'})
+    fig.update_layout(yaxis_title=None, yaxis = dict(tickfont = dict(size=10)))
+    return fig
+
+
+def scatter_settings():
+    return {"mode": SCATTER_MODE, "point_budget": SCATTER_POINT_BUDGET,
+            "hover_top": SCATTER_HOVER_TOP, "bins": SCATTER_BINS}
+
+
+def _code_digest(func, digest, seen = None):
+    """Adds the code of func to digest, with its constants, nested functions and the
+    module-level functions it calls (stratified_sample for the scatter, say)."""
+    seen = set() if seen is None else seen
+    stack = [func.__code__]
+    while stack:
+        code = stack.pop()
+        if code in seen:
+            continue
+        seen.add(code)
+        digest.update(code.co_code)
+        for const in code.co_consts:
+            if hasattr(const, "co_code"):
+                stack.append(const)
+            else:
+                digest.update(repr(const).encode())
+        for name in code.co_names:
+            helper = func.__globals__.get(name)
+            if getattr(helper, "__module__", None) == func.__module__ and hasattr(helper, "__code__"):
+                stack.append(helper.__code__)
+
+
+# figure name -> (dataset file, builder)
+FIGURES = {
+    "line_chart": ("df_ratings_avg.csv", line_chart),
+    "bar_chart": ("df_genre_rating.csv", bar_chart),
+    "scatter_chart": ("df_weights.csv", scatter_chart),
+    "heatmap": ("df_matrix.csv", heatmap),
+}
+
+
+class FigureCache:
+    """Builds each Overview figure once and keeps its JSON spec on disk.
+
+    A spec is keyed by the content hash of its dataset file, the code of its builder,
+    FIGURE_FORMAT and the scatter settings. The file hash is only recomputed when the
+    file's mtime or size changes, so checking for a stale spec on every rerun costs one
+    stat call.
+    """
+
+    def __init__(self, dataset_dir = DATASET_DIR, cache_dir = DEFAULT_CACHE_DIR, figures = FIGURES):
+        self.dataset_dir = dataset_dir
+        self.cache_dir = cache_dir
+        self.figures = figures
+        self._digests = {}
+        self._code = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def version(self, name):
+        """Hash of everything figure name is built from: its dataset file, its builder
+        and the helpers that calls, FIGURE_FORMAT and the scatter settings."""
+        file_name, builder = self.figures[name]
+        key = hashlib.sha1(self._file_digest(os.path.join(self.dataset_dir, file_name)).encode())
+        key.update(self._code_digest(name, builder).encode())
+        key.update(repr((FIGURE_FORMAT, sorted(scatter_settings().items()))).encode())
+        return key.hexdigest()
+
+    def _file_digest(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._digests.get(path)
+            if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+                return cached[1]
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        with self._lock:
+            self._digests[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+        return digest
+
+    def _code_digest(self, name, builder):
+        digest = self._code.get(name)
+        if digest is None:
+            code = hashlib.sha1()
+            _code_digest(builder, code)
+            digest = self._code[name] = code.hexdigest()
+        return digest
+
+    def build(self, name):
+        """Build figure name from its dataset file, without touching the cache."""
+        file_name, builder = self.figures[name]
+        return builder(pd.read_csv(os.path.join(self.dataset_dir, file_name)))
+
+    def spec(self, name, version = None):
+        """JSON spec of figure name, built and stored on first use of each dataset version."""
+        if version is None:
+            version = self.version(name)
+        path = os.path.join(self.cache_dir, f"{name}-{version}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read()
+        spec = self.build(name).to_json()
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(spec)
+        os.replace(tmp_path, path)
+        return spec
@@ -1,12 +1,22 @@
-import pandas as pd
+import functools
+
 import streamlit as st
+from streamlit.logger import get_logger
 from st_files_connection import FilesConnection
-import gower
-import gc
+from data_loader import LOCAL_BUCKET, local_filesystem, shared_loader
+from catalogue import CatalogueIndex, GameSearchIndex
+from recommender import SIMILARITY_BACKEND, FeatureStore, find_games, find_games_multi, RecommendationCache, recommendation_key
+from neighbour_index import load_index, find_games_indexed
+from memory_trace import MemoryTrace
+from stage_trace import TRACE, span
+from utils import game_search, show_memory, show_stages
 
 st.set_page_config(page_title="Recommendation",
                    page_icon="📊",
                    layout = 'wide')
+TRACE.begin("recommender")
+
+LOGGER = get_logger(__name__)
 st.markdown("# Board Game Recommendation")
 st.write(
     """This page recommends similar board games to the selected board game. The recommendation algorithm is based on a 
@@ -20,11 +30,33 @@ st.write(" ")
 # raw_df = st.session_state['main_data']
 
 
-@st.cache_resource(ttl=3600)
-def get_game_data():
+# local Parquet snapshots of the bucket CSVs, refreshed only when the source changes
+# and shared read-only by every page and session
+@st.cache_resource
+def get_loader():
+    if LOCAL_BUCKET:
+        return shared_loader(local_filesystem(), LOCAL_BUCKET)
     conn = st.experimental_connection('gcs', type=FilesConnection)
-    df = conn.read("boardgamewhiz-bucket/game_df.csv", input_format="csv", ttl=600)
-    return df
+    return shared_loader(conn.fs, "boardgamewhiz-bucket")
+
+@st.cache_data(ttl=600)
+def get_data_version():
+    return get_loader().version("game_df.csv")
+
+@st.cache_resource(max_entries=1)
+def get_game_data(version):
+    df = get_loader().load("game_df.csv", version)
+    # encode the similarity features once per load, not on every recommendation
+    store = FeatureStore(df)
+    # precomputed neighbours, built offline with neighbour_index.py
+    index = load_index("./dataset/neighbours", store)
+    if SIMILARITY_BACKEND == "ann":
+        from ann_index import IVFIndex, find_games_ann
+        live = functools.partial(find_games_ann, ann=IVFIndex(store))
+    else:
+        live = find_games
+    catalogue = CatalogueIndex(df)
+    return df, store, index, catalogue, GameSearchIndex(catalogue), live
 
 # @st.cache_data(ttl=3600)
 # def get_game_df(raw_df):
@@ -38,7 +70,26 @@ def get_game_data():
 #     print(game_df.columns)
 #     return game_df
 
-game_df = get_game_data()
+with span("load data"):
+    game_df, feature_store, neighbour_index, catalogue, search_index, find_games_live = get_game_data(get_data_version())
+
+# one results cache for all sessions, emptied whenever get_game_data reloads
+@st.cache_resource
+def get_recommendation_cache():
+    cache = RecommendationCache()
+    # hits, misses and evictions on the metrics endpoint and file, for sizing CACHE_BYTES
+    TRACE.register("boardgamewhiz_recommendation_cache", cache.stats, "Shared recommendation cache",
+                   counters=("hits", "misses", "evictions", "invalidations"))
+    return cache
+
+rec_cache = get_recommendation_cache()
+
+# RSS (and with MEMORY_TRACE=1 allocation) measurements of each recommendation
+@st.cache_resource
+def get_memory_trace():
+    return MemoryTrace()
+
+memory_trace = get_memory_trace()
 
 # game_attributes_df = game_df[['bgg_id','name','year','thumbnail']].copy()
 # game_attributes_df['link'] = game_attributes_df['bgg_id'].apply(lambda x: "https://boardgamegeek.com/boardgame/" + str(x))
@@ -56,53 +107,31 @@ def convert_df(input_df):
      # IMPORTANT: Cache the conversion to prevent computation on every rerun
      return input_df.to_html(escape=False, formatters=dict(Image=path_to_image_html, ID=path_to_url_html))
 
-# RECOMMENDATION ALGO
-def find_games(game_df, selected_row, selected_year = None, selected_player = None, selected_rating = None):
-    fam = selected_row['family_group'].iloc[0]
-    if fam != " ":
-        game_df = game_df[game_df['family_group'] != fam]
-    if selected_player:
-        #print('Solo selected...')
-        game_df = game_df[(game_df['min_player'] <= selected_player) & (game_df['max_player'] >= selected_player)]
-    if selected_year:
-        game_df = game_df[game_df['year'] >= selected_year]
-    if selected_rating:
-        game_df = game_df[game_df['avg_rating_group'] >= selected_rating]
-    if selected_rated:
-        game_df = game_df[game_df['user_rating'] >= selected_rated]
-        
-    # processed_name = game_df[['name','bgg_id','year']]
-
-    game_df = game_df.drop(columns = ['name','image','thumbnail','family_group','bgg_id','year','link','avg_rating','avg_rating_group','user_rating'])
-    selected_row = selected_row.drop(columns = ['name','image','thumbnail','family_group','bgg_id','year','link','avg_rating','avg_rating_group','user_rating'])
-
-    sim_measure = gower.gower_matrix(game_df, selected_row)
-    idx = sim_measure.flatten().argsort()[:11]
-    
-    if fam != " ":
-        final_idx = idx[1:11]
-    else:
-        final_idx = idx[0:11]
-    game_idx = game_df.iloc[final_idx].index
-    final_measure = sim_measure.flatten()[final_idx]
-    game_measure = (1 - final_measure)[1:]
-
-    return game_idx, game_measure
-
-g = game_df['name']
-games = sorted(g, key=str.lower)
-game_name = pd.DataFrame(game_df['name'])
-
 row1_spacer1, row1_1, row1_spacer2 = st.columns((0.020, 0.96, 0.020))
 with row1_1:
-    selected_game = st.selectbox(
-        "Board Game",
-        (
-        games
-        ),
-        index=None,
-        placeholder="Select game...",
+    # only the top matches of the search go to the browser, never the whole catalogue
+    selected_game = game_search(search_index, "Board Game", key="selected_game")
+
+row1b_spacer1, row1b_1, row1b_spacer2, row1b_2, row1b_spacer3 = st.columns((0.020, 0.7, 0.02, 0.24, 0.020))
+with row1b_1:
+    # recommend for a collection: games like all of these together
+    # offered from the same search as the main game, plus whatever is already picked
+    # (a new widget whenever the options change, so the picks are remembered separately)
+    more_picked = [g for g in st.session_state.get("more_games_selected", [])
+                   if g != selected_game and search_index.known(g)]
+    more_options = more_picked + search_index.search(st.session_state.get("selected_game_query"))
+    more_games = st.multiselect(
+        "More Games You Like (Optional)",
+        [g for g in dict.fromkeys(more_options) if g != selected_game],
+        default=more_picked,
+        placeholder="Add games...",
+        key="more_games",
     )
+    st.session_state["more_games_selected"] = more_games
+
+with row1b_2:
+    combine_modes = {"mean": "Average similarity", "min": "Closest to any"}
+    combine_by = st.selectbox("Combine By", list(combine_modes), format_func=combine_modes.get)
 
 row2_spacer1, row2_2, row2_spacer3, row2_3, row2_spacer4, row2_4, row2_spacer5, row2_5, row2_spacer6 = st.columns((0.05, 0.5, 0.05, 0.5, 0.05, 0.5, 0.05,0.5,0.05))
 
@@ -160,17 +189,20 @@ row3_1, row3_spacer1, row3_2, row3_spacer2, row3_3 = st.columns((0.2, 0.05, 0.2,
 run_algo = False
 
 if selected_game:
+    game_pos = catalogue.position(selected_game)
+    game_row = game_df.iloc[game_pos]
+
     with row3_1:
-        img_url = game_df[game_df['name'] == selected_game]['image'].values[0]
+        img_url = game_row['image']
         try:
             st.image(img_url, width =200)
         except:
             st.image("https://i.ibb.co/tPp7HDZ/no-image.png", width =200)
 
     with row3_2:
-        game_id = game_df[game_df['name'] == selected_game]['bgg_id'].values[0]
-        game_naming = game_df[game_df['name'] == selected_game]['name'].values[0]
-        game_year = game_df[game_df['name'] == selected_game]['year'].values[0]
+        game_id = game_row['bgg_id']
+        game_naming = game_row['name']
+        game_year = game_row['year']
 
         st.write(f":envelope: **Game ID**: :black[{game_id}]")
         st.write(f":game_die: **Game Name**: :black[{game_naming}]")
@@ -183,27 +215,47 @@ if selected_game:
 st.text("")
 
 if selected_game and run_algo:
-    with st.spinner('Recommendation In-Progress...'):
-        index = game_name[game_name['name'] == selected_game].index[0]
-        selected_row = game_df.loc[[index]]
-
-        final_idx, final_measure = find_games(game_df, selected_row, selected_year, selected_player, selected_rating)
+    with st.spinner('Recommendation In-Progress...'), memory_trace.measure("recommendation") as memory_record:
+        selected_row = game_df.iloc[[game_pos]]
+
+        key = recommendation_key(game_id, selected_year, selected_player, selected_rating, selected_rated)
+        if more_games:
+            seed_pos = [game_pos] + [catalogue.position(g) for g in more_games]
+            key += (combine_by, tuple(int(i) for i in game_df['bgg_id'].iloc[seed_pos]))
+        found = rec_cache.get(feature_store, key)
+        if found is None:
+            if more_games:
+                found = find_games_multi(game_df, game_df.iloc[seed_pos], selected_year, selected_player,
+                                         selected_rating, selected_rated, store=feature_store, how=combine_by)
+            else:
+                found = find_games_indexed(game_df, selected_row, selected_year, selected_player, selected_rating,
+                                           selected_rated, store=feature_store, index=neighbour_index,
+                                           live=find_games_live)
+            rec_cache.put(feature_store, key, found)
+        final_idx, final_measure = found
         #recommended_df = processed_name.iloc[final_idx]
 
-        final_df = game_df.iloc[final_idx][['bgg_id','name','year','thumbnail','link']].copy()
+        # only the shown rows and columns are copied out of the shared catalogue
+        final_df = game_df.loc[final_idx, ['bgg_id','name','year','thumbnail','link']]
         final_df = final_df.rename({'bgg_id': 'ID', 'name': 'Game', 'year':'Year Published', 'thumbnail': 'Image', 'link':'URL'}, axis=1)
 
-        html = convert_df(final_df)
+        with span("to_html") as html_span:
+            html = convert_df(final_df)
+            html_span["bytes"] = len(html)
 
         st.markdown(
         html,
         unsafe_allow_html=True)
 
-        del final_df
-        gc.collect()
+
+    LOGGER.info(MemoryTrace.describe(memory_record))
 
     #st.dataframe(recommended_df, hide_index = True)
 
+show_memory(memory_trace)
+show_stages(TRACE)
+TRACE.end()
+
 # TEMP JUST TO SHOW TOP 10 BOARD GAMES AS A TABLE
 
 # st.write("Top 10 Board Games")
@@ -1,14 +1,22 @@
-import numpy as np
+import os
+
 import streamlit as st
-import pandas as pd
-from google.oauth2 import service_account
-from st_aggrid import GridOptionsBuilder, AgGrid, JsCode, ColumnsAutoSizeMode
+from streamlit.logger import get_logger
 from st_files_connection import FilesConnection
-import gc
+from data_loader import LOCAL_BUCKET, local_filesystem, shared_loader
+from catalogue import CatalogueIndex, GameSearchIndex
+from review_facets import FACETS_FILE, ReviewFacets
+from reviews import (FETCH_SIZE, REVIEWS_SQLITE, SEARCH_DIR, SEARCH_META, STORE_OFFSETS, BigQueryBackend,
+                     ReviewService, SQLiteBackend, payload_bytes)
+from memory_trace import MemoryTrace
+from stage_trace import TRACE, span
+from utils import game_search, remembered_selectbox, show_memory, show_stages
 
 st.set_page_config(page_title="Board Game Reviews",
                    page_icon="📊",
                    layout = 'wide')
+TRACE.begin("reviews")
+LOGGER = get_logger(__name__)
 st.markdown("# Board Game Reviews")
 st.write(
     """This page shows the board game reviews. Although board game reviews are tagged with a user rating,
@@ -23,55 +31,136 @@ st.write(
 
 st.write(" ")
 
-@st.cache_resource(ttl=3600)
-def get_game_data():
+# local Parquet snapshots of the bucket CSVs, refreshed only when the source changes
+# and shared read-only by every page and session
+@st.cache_resource
+def get_loader():
+    if LOCAL_BUCKET:
+        return shared_loader(local_filesystem(), LOCAL_BUCKET)
     conn = st.experimental_connection('gcs', type=FilesConnection)
-    df = conn.read("boardgamewhiz-bucket/game_info_reviews.csv", input_format="csv", ttl=600)
-    return df
+    return shared_loader(conn.fs, "boardgamewhiz-bucket")
+
+@st.cache_data(ttl=600)
+def get_data_version():
+    return get_loader().version("game_info_reviews.csv")
+
+@st.cache_resource(max_entries=1)
+def get_game_data(version):
+    df = get_loader().load("game_info_reviews.csv", version)
+    catalogue = CatalogueIndex(df)
+    return df, catalogue, GameSearchIndex(catalogue)
 
-df = get_game_data()
+with span("load data"):
+    df, catalogue, search_index = get_game_data(get_data_version())
 
 #df['bgg_name'] = df['bgg_id'].astype(str) + ": " + df['name']
-bgg = df['name'].unique()
+
+# review counts per (game, sentiment, rating group), built offline with review_facets.py;
+# without them the options carry no counts and every selection is queried
+@st.cache_data(ttl=600)
+def get_facets_version():
+    try:
+        return get_loader().version(FACETS_FILE)
+    except FileNotFoundError:
+        return None
+
+@st.cache_resource(max_entries=1)
+def get_facets(version):
+    if version is None:
+        return None
+    return ReviewFacets(get_loader().load(FACETS_FILE, version))
+
+with span("load facets"):
+    facets = get_facets(get_facets_version())
 
 # QUERY FOR GAME REVIEWS BASED ON USER SELECTION
 
-credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"]
-)
+REVIEW_STORE = os.environ.get("BOARDGAMEWHIZ_REVIEW_STORE", "./dataset/review_store")
+
+# built on the first retrieval, not on page load: the backend imports (pyarrow or
+# google.oauth2) and the service-account credentials are only needed once reviews are asked for
+@st.cache_resource
+def get_review_service():
+    # the local store exported with review_store.py answers without a warehouse round-trip
+    if os.path.exists(os.path.join(REVIEW_STORE, STORE_OFFSETS)):
+        from review_store import LocalReviewBackend
+        return ReviewService(LocalReviewBackend(REVIEW_STORE))
+    if REVIEWS_SQLITE:
+        return ReviewService(SQLiteBackend(REVIEWS_SQLITE))
+    from google.oauth2 import service_account
+    credentials = service_account.Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"]
+    )
+    return ReviewService(BigQueryBackend(credentials))
+
+# keyword search needs the local store indexed with review_search.py; against the
+# warehouse it would be a LIKE scan, so the box is only shown when both exist
+@st.cache_data(ttl=600)
+def get_search_available():
+    return (os.path.exists(os.path.join(REVIEW_STORE, STORE_OFFSETS))
+            and os.path.exists(os.path.join(REVIEW_STORE, SEARCH_DIR, SEARCH_META)))
+
+@st.cache_resource
+def get_review_search():
+    from review_search import ReviewSearch
+    return ReviewSearch(get_review_service().backend)
+
+# RSS (and with MEMORY_TRACE=1 allocation) measurements of each review retrieval
+@st.cache_resource
+def get_memory_trace():
+    return MemoryTrace()
+
+memory_trace = get_memory_trace()
+
+# the grid only ever holds one window of reviews, the rest stay on the server
+REVIEW_WINDOW = FETCH_SIZE
+
+def next_reviews():
+    st.session_state['review_start'] += REVIEW_WINDOW
+
+def previous_reviews():
+    st.session_state['review_start'] = max(0, st.session_state['review_start'] - REVIEW_WINDOW)
 
 
 row1_spacer1, row1_1, row1_spacer2, row1_2, row1_spacer3, row1_3, row1_spacer4 = st.columns((0.05, 0.5, 0.05, 0.5, 0.05, 0.5, 0.05))
 with row1_1:
-    selected_game = st.selectbox(
-        "Select Board Game",
-        (
-        bgg
-        ),
-        index=None,
-        placeholder="Select game...",
-    )
+    selected_game = game_search(search_index, "Select Board Game", key="selected_game")
+
+game_row = catalogue.row(selected_game) if selected_game else None
+
+# the selected game's review counts, looked up before anything is queried
+game_facets = facets.game(game_row['bgg_id']) if facets is not None and game_row is not None else None
+
+def with_counts(count):
+    # the counts only label the options, the selection stays the raw value
+    if game_facets is None:
+        return str
+    return lambda option: f"{option} ({count(option):,})"
 
 with row1_2:
-    selected_sentiment = st.selectbox(
+    selected_sentiment = remembered_selectbox(
         "Select Sentiment",
-        (
-        ["Positive", "Negative", "Neutral-Positive", "Neutral-Negative"]
-        ),
-        index=None,
+        ["Positive", "Negative", "Neutral-Positive", "Neutral-Negative"],
+        key="selected_sentiment",
+        format_func=with_counts(lambda s: ReviewFacets.count(game_facets, s)),
         placeholder="Select sentiment...",
     )
 
 with row1_3:
-    selected_rating = st.selectbox(
+    selected_rating = remembered_selectbox(
         "Select Rating (Optional)",
-        (
-        ['0','1','2','3','4','5','6','7','8','9','10']
-        ),
-        index=None,
+        ['0','1','2','3','4','5','6','7','8','9','10'],
+        key="selected_rating",
+        format_func=with_counts(lambda r: ReviewFacets.count(game_facets, selected_sentiment, r)),
         placeholder="Select rating...",
     )
 
+keywords = ""
+if get_search_available():
+    row1b_spacer1, row1b_1, row1b_spacer2 = st.columns((0.05, 1.6, 0.05))
+    with row1b_1:
+        keywords = st.text_input("Reviews Mentioning (Optional)", placeholder="e.g. solo mode, rulebook").strip()
+
 st.text("")
 
 # GAME INFO TO MAKE SURE CORRECT SELECTION OF GAME BY USER
@@ -80,15 +169,15 @@ run_algo = False
 
 row2_1, row2_spacer1, row2_2, row2_spacer2, row2_3 = st.columns((0.2, 0.05, 0.2, 0.05, 0.5))
 
-if selected_game:
+if game_row is not None:
     with row2_1:
-        img_url = df[df['name'] == selected_game]['image'].values[0]
+        img_url = game_row['image']
         st.image(img_url, width =200)
 
     with row2_2:
-        game_id = df[df['name'] == selected_game]['bgg_id'].values[0]
-        game_name = df[df['name'] == selected_game]['name'].values[0]
-        game_year = df[df['name'] == selected_game]['year'].values[0]
+        game_id = game_row['bgg_id']
+        game_name = game_row['name']
+        game_year = game_row['year']
 
         st.write(f":envelope: **Game ID**: :black[{game_id}]")
         st.write(f":game_die: **Game Name**: :black[{game_name}]")
@@ -96,8 +185,13 @@ if selected_game:
 
     with row2_3:
         if st.button("Click Me to Retrieve Reviews! :rocket:", type="primary"):
-            if selected_sentiment:
+            if selected_sentiment and game_facets is not None and \
+                    ReviewFacets.count(game_facets, selected_sentiment, selected_rating) == 0:
+                "No reviews match this selection, try another sentiment or rating :open_mouth:"
+            elif selected_sentiment:
                 run_algo = True       
+                st.session_state['review_query'] = ReviewService.key(game_id, selected_sentiment, selected_rating) + (keywords,)
+                st.session_state['review_start'] = 0
             else:
                 "You need to select a \"Sentiment\" first :open_mouth:"
 
@@ -110,33 +204,28 @@ st.text("")
 # if selected_game:
 #     selected_bgg_id = int(selected_game.split(":")[0])
 
+# keep showing the retrieved reviews while the user pages through them,
+# until the selection changes
+if selected_game and selected_sentiment and not run_algo:
+    run_algo = st.session_state.get('review_query') == ReviewService.key(game_id, selected_sentiment, selected_rating) + (keywords,)
+
 if selected_game and selected_sentiment and run_algo:
 
-    if selected_rating:
-        query  = f'''
-        select ID, Game, Rating, Review, Sentiment, `Subjectivity Score`
-        from (
-        SELECT  cast(bgg_id as STRING) as ID, name as Game, rating as Rating, comment as Review, final_sentiment as Sentiment, 
-        FORMAT('%.2F', round(subjectivity,2)) as `Subjectivity Score`
-        FROM `tensile-walker-401308.eng_reviews.reviews` 
-        where name = '{selected_game}' 
-        and final_sentiment = '{selected_sentiment}'
-        and cast(rating_group as string) = '{selected_rating}'
-        order by label_proba desc)
-        '''
-    else:
-        query  = f'''
-        select ID, Game, Rating, Review, Sentiment, `Subjectivity Score`
-        from (
-        SELECT  cast(bgg_id as STRING) as ID, name as Game, rating as Rating, comment as Review, final_sentiment as Sentiment, 
-        FORMAT('%.2F', round(subjectivity,2)) as `Subjectivity Score`
-        FROM `tensile-walker-401308.eng_reviews.reviews` 
-        where name = '{selected_game}' 
-        and final_sentiment = '{selected_sentiment}'
-        order by label_proba desc)
-        '''
-    with st.spinner('Retrieving Reviews In-Progress...'):
-        reviews_df = pd.read_gbq(query, credentials = credentials)
+    with st.spinner('Retrieving Reviews In-Progress...'), memory_trace.measure("reviews") as memory_record:
+        review_start = st.session_state['review_start']
+        matched = None if game_facets is None else \
+            ReviewFacets.count(game_facets, selected_sentiment, selected_rating)
+        with span("fetch reviews"):
+            if keywords:
+                reviews_df, more_reviews, matched = get_review_search().window(
+                    game_id, keywords, selected_sentiment, selected_rating, start=review_start, rows=REVIEW_WINDOW)
+            else:
+                reviews_df, more_reviews = get_review_service().window(game_id, selected_sentiment, selected_rating,
+                                                                 start=review_start, rows=REVIEW_WINDOW)
+        if keywords and not matched:
+            f"No reviews mention \"{keywords}\" for this selection :open_mouth:"
+        grid_bytes = payload_bytes(reviews_df)
+        LOGGER.info("review grid payload: %d rows, %d bytes", len(reviews_df), grid_bytes)
 
 #     st.dataframe(reviews_df, hide_index=True)
 
@@ -145,6 +234,8 @@ if selected_game and selected_sentiment and run_algo:
     #Infer basic colDefs from dataframe types
 
         st.text("")
+
+        from st_aggrid import GridOptionsBuilder, AgGrid, JsCode, ColumnsAutoSizeMode
         
         gb = GridOptionsBuilder.from_dataframe(reviews_df)
         
@@ -182,19 +273,34 @@ if selected_game and selected_sentiment and run_algo:
         st.write("*You can hover your mouse over the 'Review' text. A tooltip will display the full review text* :wink:")
         st.text("")
 
-        grid_response = AgGrid(
-            reviews_df, 
-            gridOptions=gridOptions,
-            height=grid_height, 
-            width='100%',
-            fit_columns_on_grid_load=False,
-            columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,   # FIT_ALL_COLUMNS_TO_VIEW
-            allow_unsafe_jscode=True, #Set it to True to allow jsfunction to be injected
-            custom_css={"#gridToolBar": {"padding-bottom": "0px !important"}}
-            )
-
-        del reviews_df
-        gc.collect()
+        with span("grid") as grid_span:
+            grid_span["bytes"] = grid_bytes
+            grid_response = AgGrid(
+                reviews_df, 
+                gridOptions=gridOptions,
+                height=grid_height, 
+                width='100%',
+                fit_columns_on_grid_load=False,
+                columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,   # FIT_ALL_COLUMNS_TO_VIEW
+                allow_unsafe_jscode=True, #Set it to True to allow jsfunction to be injected
+                custom_css={"#gridToolBar": {"padding-bottom": "0px !important"}}
+                )
+
+        row3_1, row3_2, row3_3 = st.columns((0.15, 0.15, 0.7))
+        with row3_1:
+            st.button("Previous reviews", on_click=previous_reviews, disabled=review_start == 0)
+        with row3_2:
+            st.button("Next reviews", on_click=next_reviews, disabled=not more_reviews)
+        with row3_3:
+            total = "" if matched is None else f" of {matched:,}"
+            st.caption(f"Reviews {review_start + 1}-{review_start + len(reviews_df)}{total} "
+                       f"({grid_bytes / 1024:.1f} KB sent to the grid)")
+
+    LOGGER.info(MemoryTrace.describe(memory_record))
+
+show_memory(memory_trace)
+show_stages(TRACE)
+TRACE.end()
 
 
 
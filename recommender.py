@@ -0,0 +1,518 @@
+import hashlib
+import os
+import sys
+import threading
+import warnings
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from stage_trace import span
+
+# columns used for display or filtering only, never as similarity features
+NON_FEATURE_COLS = ['name','image','thumbnail','family_group','bgg_id','year','link','avg_rating','avg_rating_group','user_rating']
+
+# columns the page can filter on, kept as plain arrays for mask building
+FILTER_COLS = ['min_player','max_player','year','avg_rating_group','user_rating']
+
+# number of recommendations shown on the page
+TOP_K = 10
+
+# similarity backend of the page: "exact" Gower over the catalogue or "ann" (see ann_index.py)
+SIMILARITY_BACKEND = os.environ.get("RECOMMENDER_BACKEND", "exact")
+
+# memory cap of the shared recommendation cache
+CACHE_BYTES = 32 * 1024 * 1024
+
+# rows per step of a single-query distance pass, so concurrent queries only hold
+# block-sized temporaries instead of a copy of the whole feature matrix
+GOWER_BLOCK = 8192
+
+# rows kept per column to prove a filtered catalogue still spans the full range
+EXTREME_SAMPLE = 256
+
+# packed binary columns per word of FeatureStore.bits
+BITS_PER_WORD = 64
+
+
+def is_numeric_feature(dtype):
+    """Same rule as gower.gower_matrix: numpy number dtypes are numeric, everything else is categorical."""
+    try:
+        return np.issubdtype(dtype, np.number)
+    except TypeError:
+        # pandas extension dtypes (category, string) are treated as categorical
+        return False
+
+
+def popcount(words):
+    """Set bits per uint64 word."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    # numpy < 2 has no popcount ufunc, count bits in parallel within the word instead
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def pack_bits(flags):
+    """(n, c) boolean matrix as (n, ceil(c / 64)) uint64 words, column j in bit j % 64 of word j // 64."""
+    n_bytes = -(-flags.shape[1] // 8)
+    packed = np.zeros((len(flags), -(-flags.shape[1] // BITS_PER_WORD) * 8), dtype=np.uint8)
+    packed[:, :n_bytes] = np.packbits(flags, axis=1, bitorder='little')
+    return packed.view(np.uint64)
+
+
+def _spread(rows):
+    # evenly spaced sample, so filters on rank-ordered columns still hit some of it
+    if len(rows) <= EXTREME_SAMPLE:
+        return rows
+    return rows[np.linspace(0, len(rows) - 1, EXTREME_SAMPLE).astype(int)]
+
+
+class FeatureStore:
+    """Compact Gower feature store for the game catalogue.
+
+    Built once per loaded game_df. Numeric features are range-normalized float32 columns,
+    categorical features are int32 codes (-1 for missing, which like NaN in gower never
+    matches) and the catalogue-wide Gower ranges are kept so distances for one query row are a single vectorized pass.
+
+    Two-valued numeric columns without missing values, such as the one-hot cat_* flags,
+    are packed into the uint64 words of bits instead: their Gower term is |a - b| = a xor b,
+    so they are compared 64 at a time with XOR and popcount. num holds the other (dense)
+    numeric columns. num_cols, num_min, num_range and every scale vector list the dense
+    columns first and the binary ones after them.
+    """
+
+    def __init__(self, game_df, drop_cols=NON_FEATURE_COLS, pack_binary = True):
+        features = game_df.drop(columns=[c for c in drop_cols if c in game_df.columns])
+        numeric = np.array([is_numeric_feature(t) for t in features.dtypes], dtype=bool)
+
+        self.index = game_df.index
+        self.bgg_id = game_df['bgg_id'].to_numpy()
+        num_cols = features.columns[numeric].to_list()
+        self.cat_cols = features.columns[~numeric].to_list()
+        self.n_features = features.shape[1]
+
+        num = features[num_cols].to_numpy(dtype=np.float64)
+        with warnings.catch_warnings():
+            # all-NaN columns, gower treats their min and max as 0
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            num_min = np.nanmin(num, axis=0, initial=np.inf)
+            num_max = np.nanmax(num, axis=0, initial=-np.inf)
+        num_min = np.where(np.isfinite(num_min), num_min, 0.0)
+        num_max = np.where(np.isfinite(num_max), num_max, 0.0)
+        # gower scales by the column max first, so a zero max means the column never counts
+        num_range = np.where(num_max != 0, num_max - num_min, 0.0)
+
+        scaled = np.divide(num - num_min, num_range, out=np.zeros_like(num),
+                           where=num_range != 0).astype(np.float32)
+        scaled[np.isnan(num)] = np.nan
+
+        binary = (num_range != 0) & ((scaled == 0) | (scaled == 1)).all(axis=0)
+        if not pack_binary:
+            binary[:] = False
+        order = np.r_[np.flatnonzero(~binary), np.flatnonzero(binary)]
+        self.num_cols = [num_cols[i] for i in order]
+        self.num_min = num_min[order]
+        self.num_range = num_range[order]
+        self.n_dense = int((~binary).sum())
+        self.n_binary = int(binary.sum())
+        self.num = np.ascontiguousarray(scaled[:, ~binary])
+        self.bits = pack_bits(scaled[:, binary] == 1)
+        del scaled
+
+        # a spread of the rows sitting on each column's min and max, see ranges_unchanged
+        self.extremes = []
+        for c in np.flatnonzero(self.num_range != 0):
+            column = self.column(c)
+            at_min = np.flatnonzero(column == 0)
+            at_max = np.flatnonzero(column == 1)
+            self.extremes.append((c, _spread(at_min), len(at_min), _spread(at_max), len(at_max)))
+
+        self.cat = np.empty((len(features), len(self.cat_cols)), dtype=np.int32)
+        for i, col in enumerate(self.cat_cols):
+            self.cat[:, i] = pd.factorize(features[col])[0]
+
+        # family " " means the game has no family, so it is never used to exclude anything
+        self.family, family_names = pd.factorize(game_df['family_group'])
+        self.no_family = family_names.get_loc(" ") if " " in family_names else None
+        self.filters = {col: game_df[col].to_numpy() for col in FILTER_COLS if col in game_df.columns}
+
+        # shared by every session, so nothing may write to it
+        for array in (self.num, self.bits, self.cat, self.family, self.bgg_id, *self.filters.values()):
+            array.flags.writeable = False
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """Hash of the row order and every encoded feature value, so anything precomputed
+        from this store (the neighbour index) can tell it was built from the same catalogue."""
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            digest.update(repr((self.num_cols, self.cat_cols, self.n_features)).encode())
+            for array in (self.bgg_id.astype(np.int64), self.num, self.bits, self.cat):
+                digest.update(repr(array.shape).encode())
+                digest.update(np.ascontiguousarray(array).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def __len__(self):
+        return len(self.index)
+
+    def position(self, label):
+        """Row position of a game_df index label."""
+        return self.index.get_loc(label)
+
+    def positions_of(self, bgg_ids):
+        """Row positions of the given bgg_ids, -1 for ids not in the catalogue."""
+        return pd.Index(self.bgg_id).get_indexer(bgg_ids)
+
+    def column(self, c, rows = slice(None)):
+        """Normalized values of numeric column c (in num_cols order) at rows."""
+        if c < self.n_dense:
+            return self.num[rows, c]
+        word, bit = divmod(c - self.n_dense, BITS_PER_WORD)
+        return ((self.bits[rows, word] >> np.uint64(bit)) & np.uint64(1)).astype(np.float32)
+
+    def numeric(self, rows = None):
+        """All normalized numeric columns in num_cols order, the binary ones unpacked."""
+        num = self.num if rows is None else self.num[rows]
+        bits = self.bits if rows is None else self.bits[rows]
+        flags = np.unpackbits(np.ascontiguousarray(bits).view(np.uint8), axis=1, count=self.n_binary,
+                              bitorder='little')
+        return np.hstack([num, flags.astype(np.float32)])
+
+    def _bit_mask(self, scales):
+        # per query, the words that keep the binary columns with a nonzero scale
+        return pack_bits(np.asarray(scales)[:, self.n_dense:] != 0)
+
+    def has_family(self, pos):
+        return self.family[pos] != self.no_family
+
+    def filter_mask(self, pos, selected_year = None, selected_player = None, selected_rating = None,
+                    selected_rated = None):
+        """Boolean mask of the rows that pass every selected filter for the game at pos."""
+        mask = np.ones(len(self), dtype=bool)
+        if self.has_family(pos) and self.family[pos] >= 0:
+            # a missing family compares unequal to every row, so it excludes nothing
+            mask &= self.family != self.family[pos]
+        if selected_player:
+            mask &= self.filters['min_player'] <= selected_player
+            mask &= self.filters['max_player'] >= selected_player
+        if selected_year:
+            mask &= self.filters['year'] >= selected_year
+        if selected_rating:
+            mask &= self.filters['avg_rating_group'] >= selected_rating
+        if selected_rated:
+            mask &= self.filters['user_rating'] >= selected_rated
+        return mask
+
+    def ranges_unchanged(self, pos, mask):
+        """True when the rows in mask plus the query row still reach every column's catalogue
+        min and max, so filtered distances equal the unfiltered ones."""
+        for c, at_min, n_min, at_max, n_max in self.extremes:
+            for sample, n_rows, value in ((at_min, n_min, 0), (at_max, n_max, 1)):
+                if mask[sample].any() or pos in sample or self.column(c, pos) == value:
+                    continue
+                if n_rows <= len(sample):
+                    return False
+                if not (mask & (self.column(c) == value)).any():
+                    return False
+        return True
+
+    def distances_many(self, positions, scales=None):
+        """Gower distances from each row position in positions to every row, as a
+        (len(positions), n) float32 matrix. scales holds one scale_for() vector per query,
+        unfiltered when omitted. Works column by column so the temporary memory stays at
+        one block of distances."""
+        q_num = self.num[positions]
+        q_cat = self.cat[positions]
+        dist = np.zeros((len(positions), len(self)), dtype=np.float32)
+        if scales is None:
+            scales = np.tile((self.num_range != 0).astype(np.float32), (len(positions), 1))
+            for c in np.flatnonzero(self.num_range[:self.n_dense] != 0):
+                dist += np.abs(self.num[:, c][None, :] - q_num[:, c][:, None])
+        else:
+            scales = np.asarray(scales, dtype=np.float32)
+            for c in np.flatnonzero(scales[:, :self.n_dense].any(axis=0)):
+                # a query whose filters leave column c without a range ignores it, NaN included
+                delta = np.abs(self.num[:, c][None, :] - q_num[:, c][:, None]) * scales[:, c][:, None]
+                dist += np.where(scales[:, c][:, None] != 0, delta, 0)
+        if self.n_binary:
+            keep = self._bit_mask(scales)
+            for i, pos in enumerate(positions):
+                dist[i] += popcount((self.bits ^ self.bits[pos]) & keep[i]).sum(axis=1, dtype=np.float32)
+        for c in range(self.cat.shape[1]):
+            dist += (self.cat[:, c][None, :] != q_cat[:, c][:, None]) | (q_cat[:, c][:, None] < 0)
+        dist /= np.float32(self.n_features)
+        return dist
+
+    def scale_for(self, pos, mask=None):
+        """Per-column numeric scale of a query at pos over the catalogue filtered by mask."""
+        if mask is None or self.ranges_unchanged(pos, mask):
+            return self._scale(pos, None)
+        return self._scale(pos, self.filtered_range(mask))
+
+    def filtered_range(self, mask):
+        """Ranges of the catalogue filtered by mask, the O(n) part of scale_for, which any
+        number of queries sharing the mask can reuse: per-column (min, max) of the dense
+        columns and which bits of the binary ones are set in some row, and in every row."""
+        # fmin/fmax skip NaN like nanmin/nanmax, and are much faster than a where= reduction
+        rows = self.num[mask]
+        bits = self.bits[mask]
+        return (np.fmin.reduce(rows, axis=0, initial=np.inf), np.fmax.reduce(rows, axis=0, initial=-np.inf),
+                np.bitwise_or.reduce(bits, axis=0), np.bitwise_and.reduce(bits, axis=0))
+
+    def _scale(self, pos, filtered):
+        # gower works its ranges out over the candidates plus the query row, so a filtered
+        # catalogue rescales each numeric column by the ratio of catalogue range to filtered range
+        if filtered is None:
+            return (self.num_range != 0).astype(np.float32)
+        lo, hi, any_set, all_set = filtered
+        lo = np.fmin(lo, self.num[pos])
+        hi = np.fmax(hi, self.num[pos])
+        lo = np.where(np.isfinite(lo), lo, 0.0)
+        hi = np.where(np.isfinite(hi), hi, 0.0)
+        raw_max = self.num_min[:self.n_dense] + hi * self.num_range[:self.n_dense]
+        span = np.where(raw_max != 0, hi - lo, 0.0)
+        dense = np.divide(1.0, span, out=np.zeros_like(span), where=span > 0)
+        # a binary column keeps its range of 1 while both values are present, else it drops out
+        ones = any_set | self.bits[pos]
+        zeros = ~all_set | ~self.bits[pos]
+        both = np.unpackbits((ones & zeros).view(np.uint8), count=self.n_binary, bitorder='little')
+        return np.r_[dense, both].astype(np.float32)
+
+    def _gower(self, pos, num, bits, cat, scale):
+        q_num = self.num[pos]
+        q_cat = self.cat[pos]
+        # binary columns without a range are masked out of the XOR
+        q_bits, keep = self.bits[pos], self._bit_mask(scale[None, :])[0]
+        scale = scale[:self.n_dense]
+        # columns without a range contribute nothing, not even NaN
+        active = scale != 0
+        if not active.all():
+            q_num, scale = q_num[active], scale[active]
+        dist = np.empty(len(num), dtype=np.float32)
+        for start in range(0, len(num), GOWER_BLOCK):
+            block = num[start:start + GOWER_BLOCK]
+            if not active.all():
+                block = block[:, active]
+            part = np.abs(block - q_num) @ scale
+            if self.n_binary:
+                part += popcount((bits[start:start + GOWER_BLOCK] ^ q_bits) & keep).sum(axis=1, dtype=np.float32)
+            part += ((cat[start:start + GOWER_BLOCK] != q_cat) | (q_cat < 0)).sum(axis=1, dtype=np.float32)
+            dist[start:start + GOWER_BLOCK] = part
+        dist /= np.float32(self.n_features)
+        return dist
+
+    def distances(self, pos, mask=None):
+        """Gower distance from row position pos to every row, same values as gower.gower_matrix
+        over the rows selected by mask (rows outside mask are returned as inf)."""
+        dist = self._gower(pos, self.num, self.bits, self.cat, self.scale_for(pos, mask))
+        if mask is not None:
+            dist[~mask] = np.inf
+        return dist
+
+    def distances_rows(self, pos, rows, mask=None):
+        """Gower distances from pos to the given row positions only, scaled to the ranges of
+        the catalogue filtered by mask as in distances()."""
+        return self._gower(pos, self.num[rows], self.bits[rows], self.cat[rows], self.scale_for(pos, mask))
+
+
+def top_k(dist, k, mask=None):
+    """Row positions of the k smallest distances among mask, nearest first.
+
+    Uses a partial selection, so the cost is O(n) plus a sort of the k winners.
+    NaN distances rank last, as they do with a full argsort.
+    """
+    candidates = np.arange(len(dist)) if mask is None else np.flatnonzero(mask)
+    cand_dist = dist[candidates]
+    if k < len(cand_dist):
+        part = np.argpartition(cand_dist, k - 1)[:k]
+    else:
+        part = np.arange(len(cand_dist))
+    order = part[np.argsort(cand_dist[part], kind='stable')]
+    return candidates[order]
+
+
+# RECOMMENDATION ALGO
+def find_games(game_df, selected_row, selected_year = None, selected_player = None, selected_rating = None,
+               selected_rated = None, store = None, k = TOP_K):
+    if store is None:
+        store = FeatureStore(game_df)
+
+    pos = store.position(selected_row.index[0])
+    with span("filter"):
+        mask = store.filter_mask(pos, selected_year, selected_player, selected_rating, selected_rated)
+    with span("distance"):
+        sim_measure = store.distances(pos, mask)
+    with span("top-k"):
+        idx = top_k(sim_measure, k + 1, mask)
+        return recommendations(game_df, store, pos, idx, sim_measure[idx], k)
+
+
+def recommendations(game_df, store, pos, idx, dist, k = TOP_K):
+    """find_games' (game_idx, game_measure) result from the nearest row positions idx (and
+    their distances), nearest first, with at least k + 1 of them when available."""
+    if store.has_family(pos):
+        final_idx, final_measure = idx[1:k + 1], dist[1:k + 1]
+    else:
+        final_idx, final_measure = idx[0:k + 1], dist[0:k + 1]
+    game_idx = game_df.index[final_idx]
+    game_measure = (1 - final_measure)[1:]
+
+    return game_idx, game_measure
+
+
+# ways of combining the distances to several seed games into one score
+COMBINE_MODES = ['mean', 'min', 'weighted']
+
+
+def combine_distances(dist, how = 'mean', weights = None):
+    """One distance per row from a (seeds, n) distance matrix. A seed that is NaN to every
+    row (missing numeric feature) is left out rather than making every score NaN."""
+    if how == 'min':
+        return np.fmin.reduce(dist, axis=0)
+    if how == 'mean':
+        weights = np.ones(len(dist), dtype=np.float32)
+    elif how == 'weighted':
+        weights = np.asarray(weights, dtype=np.float32)
+        if weights.shape != (len(dist),):
+            raise ValueError("weighted needs one weight per seed game")
+    else:
+        raise ValueError(f"unknown combine mode {how!r}, expected one of {COMBINE_MODES}")
+    present = ~np.isnan(dist)
+    total = (np.where(present, dist, 0) * weights[:, None]).sum(axis=0)
+    norm = (present * weights[:, None]).sum(axis=0)
+    return np.divide(total, norm, out=np.full_like(total, np.nan), where=norm > 0)
+
+
+def find_games_multi(game_df, selected_rows, selected_year = None, selected_player = None, selected_rating = None,
+                     selected_rated = None, store = None, k = TOP_K, how = 'mean', weights = None):
+    """find_games for several seed games at once: rows are ranked by their combined distance
+    to all seeds, and the seeds and their families are left out.
+
+    Distances to every seed come from one column-by-column pass over the catalogue.
+    """
+    if store is None:
+        store = FeatureStore(game_df)
+
+    positions = np.array([store.position(label) for label in selected_rows.index])
+    with span("filter"):
+        mask = np.ones(len(store), dtype=bool)
+        for pos in positions:
+            mask &= store.filter_mask(pos, selected_year, selected_player, selected_rating, selected_rated)
+        mask[positions] = False
+
+    with span("distance"):
+        # each seed is scaled over the filtered catalogue plus itself, as gower_matrix would be;
+        # the filtered catalogue's ranges depend on the mask alone, so they are worked out once
+        filtered = None
+        scales = []
+        for pos in positions:
+            if store.ranges_unchanged(pos, mask):
+                scales.append(store._scale(pos, None))
+            else:
+                if filtered is None:
+                    filtered = store.filtered_range(mask)
+                scales.append(store._scale(pos, filtered))
+        sim_measure = combine_distances(store.distances_many(positions, scales), how, weights)
+    with span("top-k"):
+        idx = top_k(sim_measure, k, mask)
+
+    return game_df.index[idx], 1 - sim_measure[idx]
+
+
+def recommendation_key(bgg_id, selected_year = None, selected_player = None, selected_rating = None,
+                       selected_rated = None):
+    """Cache key for a query: the game plus its filters, with unset filters folded to None."""
+    filters = tuple(int(f) if f else None for f in (selected_year, selected_player, selected_rating, selected_rated))
+    return (int(bgg_id),) + filters
+
+
+class RecommendationCache:
+    """Bounded LRU cache of find_games results shared by every session.
+
+    Entries belong to the FeatureStore they were computed from; passing a different store
+    (i.e. game_df was reloaded) drops every entry. Hit, miss and eviction counters are
+    kept for sizing the cache against real traffic.
+    """
+
+    def __init__(self, max_bytes = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._store = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(key, value):
+        game_idx, game_measure = value
+        return sys.getsizeof(key) + np.asarray(game_idx).nbytes + np.asarray(game_measure).nbytes
+
+    def _check_store(self, store):
+        if self._store is None or self._store() is not store:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.nbytes = 0
+            self._store = weakref.ref(store)
+
+    def get(self, store, key):
+        with self._lock:
+            self._check_store(store)
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value[0]
+
+    def put(self, store, key, value):
+        size = self._sizeof(key, value)
+        with self._lock:
+            self._check_store(store)
+            if size > self.max_bytes:
+                return
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "invalidations": self.invalidations,
+                    "entries": len(self.entries),
+                    "bytes": self.nbytes,
+                    "max_bytes": self.max_bytes,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+# the FeatureStore of a process-pool worker, sent once through the pool's initializer
+# rather than with every task (neighbour_index.py, batch_recommend.py)
+_worker_store = None
+
+
+def init_worker_store(store):
+    """ProcessPoolExecutor initializer keeping store for worker_store()."""
+    global _worker_store
+    _worker_store = store
+
+
+def worker_store():
+    return _worker_store
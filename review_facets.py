@@ -0,0 +1,71 @@
+"""Review counts per (game, sentiment, rating group) for the Reviews page.
+
+Build it from a dump of the reviews table (CSV or Parquet, local or gs://) and upload
+it to the bucket next to game_info_reviews.csv:
+
+    python review_facets.py reviews.parquet review_facets.csv
+
+The page labels its sentiment and rating options with these counts and does not query
+for a selection with no reviews.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+FACETS_FILE = "review_facets.csv"
+
+FACET_COLUMNS = ['bgg_id', 'final_sentiment', 'rating_group']
+
+
+def build_facets(reviews):
+    """One row per (bgg_id, final_sentiment, rating_group) with its number of reviews.
+    Reviews without a rating group are counted under -1, as in the review store."""
+    keys = reviews[FACET_COLUMNS].copy()
+    keys['rating_group'] = keys['rating_group'].fillna(-1).astype('int16')
+    facets = keys.groupby(FACET_COLUMNS, sort=True, observed=True).size().rename('reviews').reset_index()
+    return facets
+
+
+class ReviewFacets:
+    """Lookups into the facet counts, sorted by bgg_id so one game's counts are a slice."""
+
+    def __init__(self, facets):
+        facets = facets.sort_values('bgg_id', kind='stable')
+        self.bgg_ids = facets['bgg_id'].to_numpy(np.int64)
+        self.sentiments = facets['final_sentiment'].astype(str).to_numpy()
+        self.rating_groups = facets['rating_group'].to_numpy(np.int64)
+        self.counts = facets['reviews'].to_numpy(np.int64)
+
+    def game(self, bgg_id):
+        """{(sentiment, rating_group): reviews} of one game, empty when it has none."""
+        start, stop = np.searchsorted(self.bgg_ids, [int(bgg_id), int(bgg_id) + 1])
+        return {(s, int(r)): int(n) for s, r, n in zip(self.sentiments[start:stop],
+                                                        self.rating_groups[start:stop],
+                                                        self.counts[start:stop])}
+
+    @staticmethod
+    def count(game, sentiment = None, rating = None):
+        """Reviews of a game() result matching the page's sentiment and rating, either
+        of which may be left unselected."""
+        return sum(n for (s, r), n in game.items()
+                   if sentiment in (None, s) and (rating in (None, "") or r == int(rating)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the review facet counts for the Reviews page.")
+    parser.add_argument("reviews", help="CSV or Parquet dump of the reviews table")
+    parser.add_argument("out", help="CSV to write, uploaded to the bucket as " + FACETS_FILE)
+    args = parser.parse_args()
+
+    if args.reviews.endswith(".parquet"):
+        reviews = pd.read_parquet(args.reviews, columns=FACET_COLUMNS)
+    else:
+        reviews = pd.read_csv(args.reviews, usecols=FACET_COLUMNS)
+    facets = build_facets(reviews)
+    facets.to_csv(args.out, index=False)
+    print(f"Counted {len(reviews)} reviews into {len(facets)} facets -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Keyword search over the review comments of a local review store.
+
+Index a store exported with review_store.py (once per export):
+
+    python review_search.py dataset/review_store
+
+The index lives in <store>/search, one inverted index per store partition. A review is
+identified by its row in the partition, and postings are kept in row order. Because the
+store sorts a partition by (bgg_id, final_sentiment, rating_group), the sentiment and
+rating filters are a row range, and they are applied to a posting list with two
+binary searches.
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+from review_store import STORE_COLUMNS, _format, _partition_path
+from reviews import FETCH_SIZE, SEARCH_DIR, SEARCH_META
+
+# words are runs of letters and digits, compared case-insensitively
+TOKEN = re.compile(r"[^\W_]+")
+
+
+def tokens(text):
+    return TOKEN.findall(text.casefold()) if text else []
+
+
+def _index_paths(path, part):
+    stem = os.path.join(path, SEARCH_DIR, f"part-{part:04d}")
+    return stem + ".terms.arrow", stem + ".rows.npy", stem + ".tf.npy"
+
+
+def build_search_index(path):
+    """Index the comments of every partition of the store at path."""
+    os.makedirs(os.path.join(path, SEARCH_DIR), exist_ok=True)
+    parts = sorted(int(name[5:9]) for name in os.listdir(path) if name.startswith("part-") and name.endswith(".arrow"))
+    for part in parts:
+        with pa.memory_map(_partition_path(path, part), "r") as source:
+            comments = pa.ipc.open_file(source).read_all().column('comment').to_pandas()
+        # (term, row, occurrences), sorted by term and then row
+        words = comments.fillna("").str.casefold().str.findall(TOKEN).explode().dropna()
+        postings = (pd.DataFrame({'term': words.to_numpy(), 'row': words.index.to_numpy()})
+                    .groupby(['term', 'row'], sort=True).size())
+        terms = postings.index.get_level_values('term')
+        starts = np.flatnonzero(np.r_[True, terms[1:] != terms[:-1]])
+
+        terms_path, rows_path, tf_path = _index_paths(path, part)
+        table = pa.table({'term': pa.array(terms[starts], pa.string()),
+                          'start': pa.array(starts, pa.int64()),
+                          'stop': pa.array(np.append(starts[1:], len(postings)), pa.int64())})
+        with pa.OSFile(terms_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        np.save(rows_path, postings.index.get_level_values('row').to_numpy(np.int32))
+        np.save(tf_path, np.minimum(postings.to_numpy(), np.iinfo(np.uint16).max).astype(np.uint16))
+
+    with open(os.path.join(path, SEARCH_DIR, SEARCH_META), "w") as f:
+        json.dump({"partitions": parts}, f)
+
+
+class ReviewSearch:
+    """Keyword queries against an indexed store, through its LocalReviewBackend.
+
+    Every query word must appear in a review. Matches are ordered by relevance, the sum
+    over the query words of idf * (1 + log tf), and then by label_proba, as the
+    unfiltered listings are.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.sentiments = sorted({sentiment for _, sentiment, _ in backend.ranges})
+        self._parts = {}
+
+    def _part(self, part):
+        found = self._parts.get(part)
+        if found is None:
+            terms_path, rows_path, tf_path = _index_paths(self.backend.path, part)
+            with pa.memory_map(terms_path, "r") as source:
+                terms = pa.ipc.open_file(source).read_all().to_pandas()
+            found = ({term: (start, stop) for term, start, stop in terms.itertuples(index=False)},
+                     np.load(rows_path, mmap_mode="r"), np.load(tf_path, mmap_mode="r"))
+            self._parts[part] = found
+        return found
+
+    def _range(self, bgg_id, sentiment, rating):
+        if sentiment is not None:
+            return self.backend.ranges.get((int(bgg_id), sentiment, None if rating is None else int(rating)))
+        # a game's rows are contiguous too, across all its sentiments
+        found = [self.backend.ranges[key] for key in ((int(bgg_id), s, None) for s in self.sentiments)
+                 if key in self.backend.ranges]
+        if not found:
+            return None
+        return found[0][0], min(r[1] for r in found), max(r[2] for r in found)
+
+    def matches(self, bgg_id, query, sentiment = None, rating = None):
+        """Partition and rows of the matching reviews, best first."""
+        words = list(dict.fromkeys(tokens(query)))
+        found = self._range(bgg_id, sentiment, rating)
+        if not words or found is None:
+            return None, np.empty(0, dtype=np.int64)
+        part, start, stop = found
+        terms, rows, tf = self._part(part)
+        table = self.backend._table(part)
+
+        hits, score = None, None
+        # rarest word first, so the intersection shrinks as early as possible
+        for word in sorted(words, key=lambda w: terms[w][1] - terms[w][0] if w in terms else 0):
+            if word not in terms:
+                return part, np.empty(0, dtype=np.int64)
+            t0, t1 = terms[word]
+            # the filter range cut out of the row-ordered posting list
+            lo, hi = t0 + np.searchsorted(rows[t0:t1], [start, stop])
+            word_rows = np.asarray(rows[lo:hi], dtype=np.int64)
+            word_score = np.log(1 + len(table) / (t1 - t0)) * (1 + np.log(np.asarray(tf[lo:hi], dtype=np.float64)))
+            if hits is None:
+                hits, score = word_rows, word_score
+            else:
+                hits, i, j = np.intersect1d(hits, word_rows, assume_unique=True, return_indices=True)
+                score = score[i] + word_score[j]
+            if not len(hits):
+                return part, hits
+
+        proba = table.column('label_proba').take(pa.array(hits)).to_numpy()
+        order = np.lexsort((-proba, -np.round(score, 6)))
+        return part, hits[order]
+
+    def window(self, bgg_id, query, sentiment = None, rating = None, start = 0, rows = FETCH_SIZE):
+        """Matches start to start + rows as (DataFrame, more, total), like ReviewService.window."""
+        part, hits = self.matches(bgg_id, query, sentiment, rating)
+        page = hits[start:start + rows]
+        if not len(page):
+            return _format(pd.DataFrame(columns=STORE_COLUMNS)), False, len(hits)
+        table = self.backend._table(part).take(pa.array(page))
+        return _format(table.to_pandas()), start + rows < len(hits), len(hits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the keyword search index of a local review store.")
+    parser.add_argument("store", help="directory of a store exported with review_store.py")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    build_search_index(args.store)
+    print(f"Indexed {args.store} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
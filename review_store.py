@@ -0,0 +1,157 @@
+"""Local, pre-sorted review store so the Reviews page can skip the warehouse.
+
+Export it from a dump of the reviews table (CSV or Parquet, local or gs://):
+
+    python review_store.py reviews.parquet dataset/review_store --partitions 64
+
+Reviews are split into Arrow IPC partitions by bgg_id. Inside a partition rows are
+ordered by (bgg_id, final_sentiment, rating_group) and then in page order, so each
+(game, sentiment, rating_group) selection is one contiguous range. offsets.parquet
+records where every range starts and stops. A (game, sentiment) selection spans all its
+rating groups, so part-NNNN.order.npy keeps its rows in page order, too. Page order is
+the one reviews.py queries with: label_proba descending, ties broken by comment, rating
+and subjectivity.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+from reviews import STORE_OFFSETS
+
+DEFAULT_PARTITIONS = 64
+
+STORE_COLUMNS = ['bgg_id', 'name', 'rating', 'rating_group', 'comment', 'final_sentiment', 'subjectivity', 'label_proba']
+
+
+def _partition_path(path, part):
+    return os.path.join(path, f"part-{part:04d}.arrow")
+
+
+def _order_path(path, part):
+    return os.path.join(path, f"part-{part:04d}.order.npy")
+
+
+def _nulls_first(col):
+    values = col.to_numpy(np.float64)
+    return np.where(np.isnan(values), -np.inf, values)
+
+
+def _page_keys(rows):
+    """np.lexsort keys, least significant first, of page order. Missing values sort as SQL
+    sorts NULLs: last for label_proba descending, first for the ascending tie keys."""
+    return (_nulls_first(rows['subjectivity']), _nulls_first(rows['rating']),
+            pd.factorize(rows['comment'], sort=True)[0], -rows['label_proba'].to_numpy(np.float64))
+
+
+def export_store(reviews, path, partitions = DEFAULT_PARTITIONS):
+    """Write the reviews DataFrame as a partitioned store under path."""
+    os.makedirs(path, exist_ok=True)
+    reviews = reviews[STORE_COLUMNS].copy()
+    # reviews without a rating group only show up in sentiment-wide selections
+    reviews['rating_group'] = reviews['rating_group'].fillna(-1).astype('int16')
+    reviews['part'] = reviews['bgg_id'] % partitions
+    reviews = reviews.iloc[np.lexsort(_page_keys(reviews) + (
+        reviews['rating_group'].to_numpy(), pd.factorize(reviews['final_sentiment'], sort=True)[0],
+        reviews['bgg_id'].to_numpy(), reviews['part'].to_numpy()))]
+
+    offsets = []
+    for part, rows in reviews.groupby('part', sort=True):
+        rows = rows.drop(columns='part').reset_index(drop=True)
+        table = pa.Table.from_pandas(rows, preserve_index=False)
+        with pa.OSFile(_partition_path(path, part), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        # row positions of each (bgg_id, final_sentiment) range, in page order
+        sentiment_range = (~rows[['bgg_id', 'final_sentiment']].duplicated()).cumsum().to_numpy()
+        np.save(_order_path(path, part), np.lexsort(_page_keys(rows) + (sentiment_range,)).astype(np.int32))
+
+        keys = rows[['bgg_id', 'final_sentiment', 'rating_group']]
+        starts = np.flatnonzero(~keys.duplicated().to_numpy())
+        stops = np.append(starts[1:], len(rows))
+        ranges = keys.iloc[starts].reset_index(drop=True)
+        ranges['part'] = part
+        ranges['start'] = starts
+        ranges['stop'] = stops
+        offsets.append(ranges)
+
+    pd.concat(offsets, ignore_index=True).to_parquet(os.path.join(path, STORE_OFFSETS), index=False)
+
+
+class LocalReviewBackend:
+    """ReviewService backend answering every query with a range read from the local store."""
+
+    def __init__(self, path):
+        self.path = path
+        offsets = pd.read_parquet(os.path.join(path, STORE_OFFSETS))
+        self.ranges = {}
+        for bgg_id, sentiment, rating_group, part, start, stop in offsets.itertuples(index=False):
+            self.ranges[(int(bgg_id), sentiment, int(rating_group))] = (int(part), int(start), int(stop))
+            # the rating groups of a sentiment are adjacent, so the sentiment alone is a range too
+            whole = self.ranges.get((int(bgg_id), sentiment, None))
+            self.ranges[(int(bgg_id), sentiment, None)] = (int(part), whole[1] if whole else int(start), int(stop))
+        missing = [part for part in offsets['part'].unique() if not os.path.exists(_order_path(path, part))]
+        if missing:
+            raise FileNotFoundError(f"{_order_path(path, missing[0])} is missing, re-export the store "
+                                    f"with review_store.py")
+        self._tables = {}
+        self._orders = {}
+
+    def _order(self, part):
+        order = self._orders.get(part)
+        if order is None:
+            order = self._orders[part] = np.load(_order_path(self.path, part), mmap_mode="r")
+        return order
+
+    def _table(self, part):
+        table = self._tables.get(part)
+        if table is None:
+            # memory-mapped and uncompressed, so slices are read without copying the partition
+            source = pa.memory_map(_partition_path(self.path, part), "r")
+            table = pa.ipc.open_file(source).read_all()
+            self._tables[part] = table
+        return table
+
+    def fetch(self, bgg_id, sentiment, rating, limit, offset):
+        key = (int(bgg_id), sentiment, None if rating is None else int(rating))
+        found = self.ranges.get(key)
+        if found is None:
+            return _format(pd.DataFrame(columns=STORE_COLUMNS))
+        part, start, stop = found
+        if rating is None:
+            # one range per rating group, read through the exported page order
+            rows = np.asarray(self._order(part)[start:stop][offset:offset + limit])
+            return _format(self._table(part).take(pa.array(rows)).to_pandas())
+        return _format(self._table(part).slice(start, stop - start).slice(offset, limit).to_pandas())
+
+
+def _format(rows):
+    return pd.DataFrame({'ID': rows['bgg_id'].astype(str),
+                         'Game': rows['name'],
+                         'Rating': rows['rating'],
+                         'Review': rows['comment'],
+                         'Sentiment': rows['final_sentiment'],
+                         'Subjectivity Score': rows['subjectivity'].astype(float).round(2).map('{:.2f}'.format)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the reviews table into a local review store.")
+    parser.add_argument("reviews", help="CSV or Parquet dump of the reviews table")
+    parser.add_argument("out_dir", help="directory to write the store to")
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    args = parser.parse_args()
+
+    if args.reviews.endswith(".parquet"):
+        reviews = pd.read_parquet(args.reviews, columns=STORE_COLUMNS)
+    else:
+        reviews = pd.read_csv(args.reviews, usecols=STORE_COLUMNS)
+    export_store(reviews, args.out_dir, args.partitions)
+    print(f"Exported {len(reviews)} reviews -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+REVIEWS_TABLE = "tensile-walker-401308.eng_reviews.reviews"
+
+# a local SQLite copy of the reviews table standing in for BigQuery (offline runs, load tests)
+REVIEWS_SQLITE = os.environ.get("BOARDGAMEWHIZ_REVIEWS_SQLITE")
+
+# rows fetched per round-trip, the grid shows 10 per page
+FETCH_SIZE = 50
+
+# how long fetched reviews are reused and how many queries are kept
+CACHE_TTL = 600
+CACHE_ENTRIES = 256
+
+REVIEW_COLUMNS = ['ID', 'Game', 'Rating', 'Review', 'Sentiment', 'Subjectivity Score']
+
+# layout of a local review store (review_store.py) and its search index (review_search.py),
+# here so the page can look for them without importing pyarrow
+STORE_OFFSETS = "offsets.parquet"
+SEARCH_DIR = "search"
+SEARCH_META = "meta.json"
+
+
+class BigQueryBackend:
+    """Reviews from the BigQuery table, with every user value passed as a query parameter.
+
+    A selection is queried once, when its first rows are asked for. Later pages are read
+    from that job's result table with list_rows, which is not billed as another scan of
+    the reviews table. Asking for the first rows again starts a fresh query.
+    """
+
+    def __init__(self, credentials, table = REVIEWS_TABLE, max_jobs = CACHE_ENTRIES):
+        from google.cloud import bigquery
+
+        self.client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+        self.table = table
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _query(self, bgg_id, sentiment, rating):
+        from google.cloud import bigquery
+
+        rating_filter = "and cast(rating_group as string) = @rating" if rating is not None else ""
+        # label_proba ties are broken by the shown columns, so the row order is fixed
+        query = f'''
+        SELECT  cast(bgg_id as STRING) as ID, name as Game, rating as Rating, comment as Review, final_sentiment as Sentiment,
+        FORMAT('%.2F', round(subjectivity,2)) as `Subjectivity Score`
+        FROM `{self.table}`
+        where bgg_id = @bgg_id
+        and final_sentiment = @sentiment
+        {rating_filter}
+        order by label_proba desc, comment, rating, subjectivity
+        '''
+        params = [bigquery.ScalarQueryParameter("bgg_id", "INT64", int(bgg_id)),
+                  bigquery.ScalarQueryParameter("sentiment", "STRING", sentiment)]
+        if rating is not None:
+            params.append(bigquery.ScalarQueryParameter("rating", "STRING", str(rating)))
+        job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
+        job.result()
+        return job
+
+    def fetch(self, bgg_id, sentiment, rating, limit, offset):
+        key = (int(bgg_id), sentiment, rating)
+        with self._lock:
+            job = self.jobs.get(key)
+        if job is None or offset == 0:
+            job = self._query(bgg_id, sentiment, rating)
+            with self._lock:
+                self.jobs[key] = job
+                self.jobs.move_to_end(key)
+                while len(self.jobs) > self.max_jobs:
+                    self.jobs.popitem(last=False)
+        rows = self.client.list_rows(job.destination, start_index=int(offset), max_results=int(limit))
+        return rows.to_dataframe()
+
+
+class SQLiteBackend:
+    """Reviews from a local SQLite table with the same columns as the BigQuery one
+    (bgg_id, name, rating, rating_group, comment, final_sentiment, subjectivity, label_proba)."""
+
+    def __init__(self, path, table = "reviews"):
+        self.path = path
+        self.table = table
+
+    def fetch(self, bgg_id, sentiment, rating, limit, offset):
+        rating_filter = "and cast(rating_group as integer) = ?" if rating is not None else ""
+        query = f'''
+        SELECT cast(bgg_id as text) as ID, name as Game, rating as Rating, comment as Review, final_sentiment as Sentiment,
+        printf('%.2f', round(subjectivity, 2)) as "Subjectivity Score"
+        FROM {self.table}
+        where bgg_id = ?
+        and final_sentiment = ?
+        {rating_filter}
+        order by label_proba desc, comment, rating, subjectivity
+        limit ? offset ?
+        '''
+        params = [int(bgg_id), sentiment] + ([int(rating)] if rating is not None else []) + [int(limit), int(offset)]
+        with sqlite3.connect(self.path) as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+
+class ReviewService:
+    """Paged review retrieval with a TTL cache keyed by (bgg_id, sentiment, rating).
+
+    Reviews are fetched FETCH_SIZE rows at a time, so the first page needs one small
+    query and later rows are only fetched when asked for. Fetched rows are shared by
+    every session until the TTL expires.
+    """
+
+    def __init__(self, backend, fetch_size = FETCH_SIZE, ttl = CACHE_TTL, max_entries = CACHE_ENTRIES):
+        self.backend = backend
+        self.fetch_size = fetch_size
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(bgg_id, sentiment, rating = None):
+        return (int(bgg_id), sentiment, None if rating in (None, "") else str(rating))
+
+    def _entry(self, key):
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry["loaded"] > self.ttl:
+            entry = {"loaded": time.monotonic(), "frames": [], "complete": False, "lock": threading.Lock()}
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.entries.move_to_end(key)
+        return entry
+
+    def reviews(self, bgg_id, sentiment, rating = None, rows = FETCH_SIZE):
+        """The first `rows` reviews (fewer when the game has fewer), best match first.
+
+        Returns (DataFrame, more) where more tells whether further rows exist.
+        """
+        return self.window(bgg_id, sentiment, rating, 0, rows)
+
+    def window(self, bgg_id, sentiment, rating = None, start = 0, rows = FETCH_SIZE):
+        """Reviews start to start + rows, best match first, as (DataFrame, more)."""
+        key = self.key(bgg_id, sentiment, rating)
+        stop = start + rows
+        with self._lock:
+            entry = self._entry(key)
+        # one query in flight per key, other keys fetch in parallel
+        with entry["lock"]:
+            fetched = sum(len(f) for f in entry["frames"])
+            while fetched < stop and not entry["complete"]:
+                frame = self.backend.fetch(key[0], key[1], key[2], self.fetch_size, fetched)
+                entry["frames"].append(frame)
+                fetched += len(frame)
+                entry["complete"] = len(frame) < self.fetch_size
+            frames = list(entry["frames"])
+            complete = entry["complete"]
+
+        # only the fetched frames overlapping the window are copied, not everything fetched so far
+        parts, offset = [], 0
+        for frame in frames:
+            if offset < stop and offset + len(frame) > start:
+                parts.append(frame.iloc[max(start - offset, 0):stop - offset])
+            offset += len(frame)
+        if parts:
+            df = pd.concat(parts, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=REVIEW_COLUMNS)
+        more = offset > stop or not complete
+        return df, more
+
+
+def payload_bytes(df):
+    """Size of df as the JSON records the grid component sends to the browser."""
+    return len(df.to_json(orient="records").encode("utf-8"))
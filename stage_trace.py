@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOGGER = logging.getLogger(__name__)
+
+# Prometheus text exposition of the stage histograms, rewritten after every rerun when set
+METRICS_FILE = os.environ.get("BOARDGAMEWHIZ_METRICS_FILE")
+# and/or served on http://127.0.0.1:<port>/metrics
+METRICS_PORT = int(os.environ.get("BOARDGAMEWHIZ_METRICS_PORT", "0") or 0)
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# finished reruns kept for the debug panel
+HISTORY = 50
+
+
+class Histogram:
+    """A cumulative Prometheus histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        out = [f'{name}_bucket{{{labels},le="{bound:g}"}} {n}' for bound, n in zip(self.buckets, self.counts)]
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        out.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        out.append(f'{name}_count{{{labels}}} {self.count}')
+        return out
+
+
+class StageTrace:
+    """Per-rerun timing of the pages' stages, aggregated into histograms per (page, stage).
+
+    A page calls begin(page) as its script starts and end() as it finishes. In between,
+    span(stage) times a block, on whichever thread the session's script runs. A span may
+    carry the payload it produced in span["bytes"]. Spans outside a rerun, as in the batch
+    and benchmark scripts, cost one clock read and are not recorded. A rerun interrupted
+    by a widget change never reaches end() and is dropped.
+    """
+
+    def __init__(self, history = HISTORY):
+        self.seconds = {}
+        self.payload = {}
+        self.reruns = deque(maxlen=history)
+        self.collectors = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def begin(self, page):
+        self._local.rerun = {"page": page, "started": time.perf_counter(), "spans": []}
+        if METRICS_PORT and self._server is None:
+            self.serve(METRICS_PORT)
+        return self._local.rerun
+
+    def current(self):
+        return getattr(self._local, "rerun", None)
+
+    @contextmanager
+    def span(self, stage):
+        record = {"stage": stage}
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - started
+            rerun = self.current()
+            if rerun is not None:
+                rerun["spans"].append(record)
+
+    def end(self):
+        """Closes the thread's rerun, adds its spans to the histograms and returns it."""
+        rerun = self.current()
+        if rerun is None:
+            return None
+        self._local.rerun = None
+        rerun["seconds"] = time.perf_counter() - rerun["started"]
+        page = rerun["page"]
+        with self._lock:
+            self._observe(self.seconds, SECONDS_BUCKETS, page, "rerun", rerun["seconds"])
+            for span in rerun["spans"]:
+                self._observe(self.seconds, SECONDS_BUCKETS, page, span["stage"], span["seconds"])
+                if "bytes" in span:
+                    self._observe(self.payload, BYTES_BUCKETS, page, span["stage"], span["bytes"])
+            self.reruns.append(rerun)
+        if METRICS_FILE:
+            self.write(METRICS_FILE)
+        return rerun
+
+    @staticmethod
+    def _observe(histograms, buckets, page, stage, value):
+        key = (page, stage)
+        if key not in histograms:
+            histograms[key] = Histogram(buckets)
+        histograms[key].observe(value)
+
+    def register(self, name, collect, help_text, counters = ()):
+        """Exports the numbers collect() returns, a dict, as name_<key> gauges, and the keys
+        in counters as name_<key>_total counters. Registering a name again replaces it."""
+        with self._lock:
+            self.collectors[name] = (collect, help_text, tuple(counters))
+
+    def latest(self):
+        with self._lock:
+            return list(self.reruns)
+
+    def prometheus(self):
+        """The histograms and registered collectors in the Prometheus text exposition format."""
+        out = []
+        with self._lock:
+            for name, histograms, help_text in (
+                    ("boardgamewhiz_stage_seconds", self.seconds, "Duration of a page stage per rerun."),
+                    ("boardgamewhiz_stage_payload_bytes", self.payload, "Bytes a page stage produced.")):
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} histogram")
+                for (page, stage), histogram in sorted(histograms.items()):
+                    out.extend(histogram.lines(name, f'page="{_escape(page)}",stage="{_escape(stage)}"'))
+            collectors = sorted(self.collectors.items())
+        # collected outside the lock, a collector may take locks of its own
+        for prefix, (collect, help_text, counters) in collectors:
+            for key, value in collect().items():
+                kind = "counter" if key in counters else "gauge"
+                name = f"{prefix}_{key}_total" if kind == "counter" else f"{prefix}_{key}"
+                out.append(f"# HELP {name} {help_text} ({key}).")
+                out.append(f"# TYPE {name} {kind}")
+                out.append(f"{name} {value}")
+        return "\n".join(out) + "\n"
+
+    def write(self, path):
+        # written aside and renamed, so a scraper never reads half a file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def serve(self, port, host = "127.0.0.1"):
+        """Serves /metrics from a daemon thread. Only the first call in a process binds."""
+        with self._lock:
+            if self._server is not None:
+                return self._server
+            trace = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = trace.prometheus().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                self._server = ThreadingHTTPServer((host, port), Handler)
+            except OSError as e:
+                # another replica on this host holds the port; keep the histograms anyway
+                LOGGER.warning("metrics endpoint not started on %s:%d: %s", host, port, e)
+                self._server = False
+                return None
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            return self._server
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# one trace per process, so every page and module reports into the same histograms
+TRACE = StageTrace()
+span = TRACE.span
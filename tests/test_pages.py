@@ -0,0 +1,75 @@
+"""The pages run through the load-test harness against synthetic fixtures, across a reload
+of the catalogue that removes the game a session has selected."""
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gower")
+
+from benchmarks.load_test import Harness, _widget, make_fixtures
+
+PAGES = {"pages/0_Recommender.py": ("Board Game", "game_df.csv"),
+         "pages/1_Board_Game_Reviews.py": ("Select Board Game", "game_info_reviews.csv")}
+
+
+@pytest.fixture(scope="module")
+def fixtures(tmp_path_factory):
+    import data_loader
+    import reviews
+
+    path = str(tmp_path_factory.mktemp("pages"))
+    bucket, db = make_fixtures(path, 300, 20, 10)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("BOARDGAMEWHIZ_REVIEW_STORE", os.path.join(path, "no-review-store"))
+        # read when the modules are imported, which an earlier test may already have done
+        patch.setattr(data_loader, "LOCAL_BUCKET", bucket)
+        patch.setattr(reviews, "REVIEWS_SQLITE", db)
+        yield bucket
+
+
+def run(harness, page, tree = None):
+    tree, _, error = harness.run(page, tree)
+    assert error is None, error
+    return tree
+
+
+def selectbox(tree, label):
+    return next(w for w in tree.get("selectbox") if w.label == label)
+
+
+@pytest.mark.parametrize("page", list(PAGES))
+def test_selection_removed_by_reload(fixtures, page):
+    import streamlit as st
+
+    label, file_name = PAGES[page]
+    harness = Harness()
+    renamed = {"Game 3": "Game 3 (Second Edition)"}
+    tree = run(harness, page)
+    _widget(tree, "text_input", f"Search {label}").set_value("Game 3")
+    tree = run(harness, page, tree)
+    selectbox(tree, label).set_value("Game 3")
+    if page == "pages/0_Recommender.py":
+        tree = run(harness, page, tree)
+        more = tree.get("multiselect")[0]
+        picked = next(g for g in more.options if g != "Game 3")
+        more.set_value([picked])
+        renamed[picked] = picked + " (Deluxe)"
+    tree = run(harness, page, tree)
+    assert selectbox(tree, label).value == "Game 3"
+
+    # the next version of the file renames the selected games
+    csv = os.path.join(fixtures, file_name)
+    original = pd.read_csv(csv)
+    original.assign(name=original['name'].replace(renamed)).to_csv(csv, index=False)
+    try:
+        st.cache_data.clear()
+        tree = run(harness, page, tree)
+        assert selectbox(tree, label).value is None
+        assert tree.session_state["selected_game_selected"] is None
+        if page == "pages/0_Recommender.py":
+            assert tree.get("multiselect")[0].value == []
+    finally:
+        original.to_csv(csv, index=False)
+        st.cache_data.clear()
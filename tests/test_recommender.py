@@ -0,0 +1,89 @@
+"""find_games against the page's original implementation (filtered frame, gower_matrix,
+full argsort), over a synthetic catalogue and the filter values the Recommender offers."""
+import itertools
+
+import numpy as np
+import pytest
+
+gower = pytest.importorskip("gower")
+
+from benchmarks.synthetic import make_catalogue
+from recommender import NON_FEATURE_COLS, FeatureStore, find_games
+
+# the Recommender's widgets: year, player count, min. rating and the min. user rated slider
+YEARS = list(range(2023, 1989, -1))
+PLAYERS = [1, 2, 3, 4, 5, 6]
+RATINGS = [10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+RATED = list(range(0, 10001, 100))
+
+
+def legacy_find_games(game_df, selected_row, selected_year = None, selected_player = None, selected_rating = None,
+                      selected_rated = None):
+    fam = selected_row['family_group'].iloc[0]
+    if fam != " ":
+        game_df = game_df[game_df['family_group'] != fam]
+    if selected_player:
+        game_df = game_df[(game_df['min_player'] <= selected_player) & (game_df['max_player'] >= selected_player)]
+    if selected_year:
+        game_df = game_df[game_df['year'] >= selected_year]
+    if selected_rating:
+        game_df = game_df[game_df['avg_rating_group'] >= selected_rating]
+    if selected_rated:
+        game_df = game_df[game_df['user_rating'] >= selected_rated]
+
+    game_df = game_df.drop(columns=NON_FEATURE_COLS)
+    selected_row = selected_row.drop(columns=NON_FEATURE_COLS)
+
+    sim_measure = gower.gower_matrix(game_df, selected_row)
+    idx = sim_measure.flatten().argsort()[:11]
+
+    if fam != " ":
+        final_idx = idx[1:11]
+    else:
+        final_idx = idx[0:11]
+    game_idx = game_df.iloc[final_idx].index
+    final_measure = sim_measure.flatten()[final_idx]
+    game_measure = (1 - final_measure)[1:]
+
+    return game_idx, game_measure
+
+
+@pytest.fixture(scope="module")
+def catalogue():
+    game_df = make_catalogue(400, seed=3)
+    return game_df, FeatureStore(game_df)
+
+
+def query_rows(game_df):
+    # games with and without a family, which the ranking treats differently
+    with_family = np.flatnonzero(game_df['family_group'].to_numpy() != " ")[:2]
+    without_family = np.flatnonzero(game_df['family_group'].to_numpy() == " ")[:2]
+    return list(with_family) + list(without_family)
+
+
+def assert_same(game_df, store, pos, filters):
+    selected_row = game_df.iloc[[pos]]
+    expected_idx, expected_measure = legacy_find_games(game_df, selected_row, *filters)
+    game_idx, game_measure = find_games(game_df, selected_row, *filters, store=store)
+    assert list(game_idx) == list(expected_idx), filters
+    np.testing.assert_allclose(game_measure, expected_measure, atol=1e-5, err_msg=str(filters))
+
+
+@pytest.mark.parametrize("name, values", [("year", YEARS), ("player", PLAYERS), ("rating", RATINGS),
+                                          ("rated", RATED)])
+def test_each_filter_value(catalogue, name, values):
+    game_df, store = catalogue
+    slot = ["year", "player", "rating", "rated"].index(name)
+    for pos in query_rows(game_df):
+        for value in values:
+            filters = [None] * 4
+            filters[slot] = value
+            assert_same(game_df, store, pos, filters)
+
+
+def test_filter_combinations(catalogue):
+    game_df, store = catalogue
+    combinations = itertools.product([None, 2005, 2018], [None, 2, 4], [None, 6, 8], [None, 100, 1000])
+    for filters in combinations:
+        for pos in query_rows(game_df):
+            assert_same(game_df, store, pos, filters)
@@ -14,6 +14,7 @@
 
 import inspect
 import textwrap
+import time
 
 import streamlit as st
 
@@ -26,3 +27,64 @@ def show_code(demo):
         st.markdown("## Code")
         sourcelines, _ = inspect.getsourcelines(demo)
         st.code(textwrap.dedent("".join(sourcelines[1:])))
+
+
+def show_memory(trace):
+    """Showing the latest memory measurements of the page (a memory_trace.MemoryTrace)."""
+    show_memory = st.sidebar.checkbox("Show memory usage", False)
+    if show_memory:
+        records = trace.latest()
+        if not records:
+            st.sidebar.write("No measurements yet.")
+            return
+        st.sidebar.markdown("## Memory")
+        st.sidebar.dataframe([{"step": r["label"],
+                               "ms": round(r["seconds"] * 1e3, 1),
+                               "rss MB": round(r["rss_after"] / 2 ** 20, 1),
+                               "rss delta MB": round((r["rss_after"] - r["rss_before"]) / 2 ** 20, 1),
+                               "traced peak MB": round(r["peak"] / 2 ** 20, 1) if "peak" in r else None}
+                              for r in reversed(records)], hide_index=True)
+
+
+def show_stages(trace):
+    """Showing the timing breakdown of the current rerun (a stage_trace.StageTrace), so far."""
+    show_stages = st.sidebar.checkbox("Show timing breakdown", False)
+    if show_stages:
+        rerun = trace.current()
+        if rerun is None or not rerun["spans"]:
+            st.sidebar.write("No stages timed in this rerun.")
+            return
+        st.sidebar.markdown("## Timing")
+        st.sidebar.dataframe([{"stage": s["stage"],
+                               "ms": round(s["seconds"] * 1e3, 1),
+                               "KB": round(s["bytes"] / 1024, 1) if "bytes" in s else None}
+                              for s in rerun["spans"]], hide_index=True)
+        st.sidebar.caption(f"{(time.perf_counter() - rerun['started']) * 1e3:.0f} ms into this rerun")
+
+
+def remembered_selectbox(label, options, key, format_func = str, placeholder = "Choose an option", valid = None):
+    """A select box whose selection survives a change to its options or to how they are
+    labelled. Streamlit makes either one a new widget, so the selected value is kept in
+    session state under <key>_selected and passed back in as the index. A remembered
+    value valid() rejects is dropped, and the box starts out unselected."""
+    options = list(options)
+    selected = st.session_state.get(f"{key}_selected")
+    if selected is not None and valid is not None and not valid(selected):
+        selected = None
+    if selected is not None and selected not in options:
+        options = [selected] + options
+    selected = st.selectbox(label, options, index=None if selected is None else options.index(selected),
+                            format_func=format_func, key=key, placeholder=placeholder)
+    if selected is not None and valid is not None and not valid(selected):
+        selected = None
+    st.session_state[f"{key}_selected"] = selected
+    return selected
+
+
+def game_search(search_index, label, key, placeholder="Select game..."):
+    """Search box plus a select box holding only the best matches (a catalogue.GameSearchIndex),
+    so the browser never receives the whole catalogue. Returns the selected label or None."""
+    query = st.text_input(f"Search {label}", key=f"{key}_query", placeholder="Type part of a game name...")
+    # a game renamed or removed since the catalogue was reloaded is no longer selected
+    return remembered_selectbox(label, search_index.search(query), key, placeholder=placeholder,
+                                valid=search_index.known)